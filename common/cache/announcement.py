@@ -0,0 +1,83 @@
+from flask import current_app
+from redis.exceptions import RedisError
+from sqlalchemy.orm import load_only
+from sqlalchemy.exc import DatabaseError
+
+from models.notice import Announcement
+from . import constants
+from .serializer import CompactSerializer
+
+
+class AnnouncementDetailCache(object):
+    """
+    系统公告详细信息缓存
+    """
+    # 公告不存在时缓存的值
+    NOT_EXISTS = b'-1'
+
+    serializer = CompactSerializer({
+        1: ('id', 'title', 'pubdate', 'content'),
+    })
+
+    def __init__(self, announcement_id):
+        self.key = 'announce:{}'.format(announcement_id)
+        self.announcement_id = announcement_id
+
+    def get(self):
+        """
+        获取公告详情
+        :return: dict or None
+        """
+        r = current_app.redis_cluster
+        try:
+            ret = r.get(self.key)
+        except RedisError as e:
+            current_app.logger.error(e)
+            ret = None
+
+        if ret == self.NOT_EXISTS:
+            return None
+        if ret:
+            announcement = self.serializer.loads(ret)
+            if announcement is not None:
+                return announcement
+
+        try:
+            announcement = Announcement.query.options(load_only(
+                Announcement.id,
+                Announcement.title,
+                Announcement.content,
+                Announcement.pubtime
+            )).filter_by(id=self.announcement_id, status=Announcement.STATUS.PUBLISHED).first()
+        except DatabaseError as e:
+            current_app.logger.error(e)
+            raise e
+
+        if announcement is None:
+            try:
+                r.setex(self.key, constants.AnnouncementNotExistsCacheTTL.get_val(), self.NOT_EXISTS)
+            except RedisError as e:
+                current_app.logger.error(e)
+            return None
+
+        announcement_dict = {
+            'id': announcement.id,
+            'title': announcement.title,
+            'pubdate': announcement.pubtime.strftime('%Y-%m-%d %H:%M:%S'),
+            'content': announcement.content,
+        }
+        try:
+            r.setex(self.key, constants.AnnouncementDetailCacheTTL.get_val(), self.serializer.dumps(announcement_dict))
+        except RedisError as e:
+            current_app.logger.error(e)
+
+        return announcement_dict
+
+    def clear(self):
+        """
+        清除缓存
+        """
+        try:
+            current_app.redis_cluster.delete(self.key)
+        except RedisError as e:
+            current_app.logger.error(e)
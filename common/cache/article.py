@@ -0,0 +1,169 @@
+import json
+from flask import current_app
+from redis.exceptions import RedisError
+from sqlalchemy.orm import load_only, joinedload
+from sqlalchemy.exc import DatabaseError
+
+from models.news import Article, ArticleContent
+from . import constants
+from .base import RecordHashCache
+from .serializer import CompactSerializer
+from .user import UserProfileCache
+
+
+class ArticleInfoCache(RecordHashCache):
+    """
+    文章基本信息缓存
+    """
+    key_format = 'art:{}:info'
+    ttl = constants.ArticleInfoCacheTTL
+    not_exists_ttl = constants.ArticleNotExistsCacheTTL
+
+    @classmethod
+    def _load_many(cls, article_ids):
+        """
+        从数据库批量查询文章基本信息，一次查询，不加载关联关系
+        :param article_ids: 文章id列表
+        :return: dict {article_id: info}
+        """
+        try:
+            articles = Article.query.options(load_only(
+                Article.id,
+                Article.user_id,
+                Article.channel_id,
+                Article.title,
+                Article.cover,
+                Article.ctime,
+                Article.allow_comment
+            )).filter(Article.id.in_(article_ids), Article.status == Article.STATUS.APPROVED).all()
+        except DatabaseError as e:
+            current_app.logger.error(e)
+            raise e
+
+        return {
+            article.id: {
+                'art_id': article.id,
+                'title': article.title,
+                'aut_id': article.user_id,
+                'ch_id': article.channel_id,
+                'cover': article.cover,
+                'pubdate': article.ctime.strftime('%Y-%m-%d %H:%M:%S'),
+                'allow_comm': bool(article.allow_comment),
+            } for article in articles
+        }
+
+    @classmethod
+    def _to_hash(cls, record):
+        data = dict(record)
+        data['cover'] = json.dumps(record['cover'])
+        data['allow_comm'] = 1 if record['allow_comm'] else 0
+        return data
+
+    @classmethod
+    def _from_hash(cls, data):
+        data['art_id'] = int(data['art_id'])
+        data['aut_id'] = int(data['aut_id'])
+        data['ch_id'] = int(data['ch_id'])
+        data['cover'] = json.loads(data['cover'])
+        data['allow_comm'] = data.get('allow_comm') == '1'
+        return data
+
+    @classmethod
+    def get_cards(cls, article_ids):
+        """
+        获取文章列表展示数据（含作者信息），用于feed流
+        文章信息与作者信息各自批量获取，网络往返次数与文章数量无关
+        :param article_ids: 文章id列表
+        :return: list 按article_ids顺序排列，不存在的文章被忽略
+        """
+        articles = cls.get_many(article_ids)
+        authors = UserProfileCache.get_many([article['aut_id'] for article in articles.values()])
+
+        cards = []
+        for article_id in article_ids:
+            article = articles.get(article_id)
+            if article is None:
+                continue
+            author = authors.get(article['aut_id']) or {}
+            card = dict(article)
+            card['aut_name'] = author.get('name', '')
+            card['aut_photo'] = author.get('photo', '')
+            cards.append(card)
+        return cards
+
+
+class ArticleDetailCache(object):
+    """
+    文章详情内容缓存
+    """
+    # 文章不存在时缓存的值
+    NOT_EXISTS = b'-1'
+
+    serializer = CompactSerializer({
+        1: ('art_id', 'title', 'pubdate', 'aut_id', 'ch_id', 'allow_comm', 'content'),
+    })
+
+    def __init__(self, article_id):
+        self.key = 'art:{}:detail'.format(article_id)
+        self.article_id = article_id
+
+    def get(self):
+        """
+        获取文章详情
+        :return: dict or None
+        """
+        r = current_app.redis_cluster
+        try:
+            ret = r.get(self.key)
+        except RedisError as e:
+            current_app.logger.error(e)
+            ret = None
+
+        if ret == self.NOT_EXISTS:
+            return None
+        if ret:
+            article = self.serializer.loads(ret)
+            if article is not None:
+                return article
+
+        try:
+            article = Article.query.options(
+                load_only(Article.id, Article.title, Article.ctime, Article.user_id, Article.channel_id,
+                          Article.allow_comment),
+                joinedload(Article.content, innerjoin=True).load_only(ArticleContent.content)
+            ).filter_by(id=self.article_id, status=Article.STATUS.APPROVED).first()
+        except DatabaseError as e:
+            current_app.logger.error(e)
+            raise e
+
+        if article is None:
+            try:
+                r.setex(self.key, constants.ArticleNotExistsCacheTTL.get_val(), self.NOT_EXISTS)
+            except RedisError as e:
+                current_app.logger.error(e)
+            return None
+
+        article_dict = {
+            'art_id': article.id,
+            'title': article.title,
+            'pubdate': article.ctime.strftime('%Y-%m-%d %H:%M:%S'),
+            'aut_id': article.user_id,
+            'ch_id': article.channel_id,
+            'allow_comm': bool(article.allow_comment),
+            'content': article.content.content,
+        }
+        try:
+            r.setex(self.key, constants.ArticleDetailCacheTTL.get_val(), self.serializer.dumps(article_dict))
+        except RedisError as e:
+            current_app.logger.error(e)
+
+        return article_dict
+
+    def clear(self):
+        """
+        清除缓存
+        """
+        try:
+            current_app.redis_cluster.delete(self.key)
+        except RedisError as e:
+            current_app.logger.error(e)
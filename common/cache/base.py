@@ -0,0 +1,311 @@
+import time
+from flask import current_app
+from redis.exceptions import RedisError
+
+from . import constants
+from .local import MISSING
+from .invalidation import invalidation_bus
+from .singleflight import SingleFlight, RedisLease, should_refresh_early
+
+
+# 记录不存在时缓存的hash字段，防止缓存穿透
+NOT_EXISTS_FIELD = '-1'
+
+# 记录的逻辑过期时间戳字段
+EXPIRE_AT_FIELD = '_exp'
+
+# 记录上次重建耗时字段，用于概率提前刷新
+DELTA_FIELD = '_dt'
+
+# 进程内合并并发的缓存未命中
+_single_flight = SingleFlight()
+
+# 跨进程的缓存重建租约
+_lease = RedisLease()
+
+
+def chunks(items, size):
+    """
+    按批次切分列表
+    :param items: list
+    :param size: 每批数量
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class RecordHashCache(object):
+    """
+    使用redis hash缓存单条记录的缓存基类
+    查询顺序：进程内LRU缓存（可选） -> redis集群 -> 数据库
+    缓存未命中时进程内合并加载，进程间通过租约避免同时查询数据库，热点记录在过期前概率提前刷新
+    """
+    # redis键格式，由子类设置，如 'user:{}:profile'
+    key_format = ''
+
+    # 记录的缓存有效期，BaseCacheTTL子类
+    ttl = None
+
+    # 记录不存在时的缓存有效期，BaseCacheTTL子类
+    not_exists_ttl = None
+
+    # 进程内缓存，LocalLRUCache对象，为None时不使用，需注册到invalidation_bus
+    local_cache = None
+
+    def __init__(self, record_id):
+        self.record_id = record_id
+        self.key = self.key_format.format(record_id)
+
+    def get(self):
+        """
+        获取记录
+        :return: dict or None 记录不存在时返回None
+        """
+        return self.get_many([self.record_id]).get(self.record_id)
+
+    def exists(self):
+        """
+        判断记录是否存在
+        :return: bool
+        """
+        return self.get() is not None
+
+    def clear(self):
+        """
+        清除缓存
+        """
+        self.clear_many([self.record_id])
+
+    @classmethod
+    def clear_many(cls, record_ids):
+        """
+        批量清除缓存及重建租约，并通知所有进程失效进程内缓存
+        先删除redis缓存再通知，避免其他进程失效后立即从redis重新加载旧数据，
+        删除租约使之后的读取立即重建，而不是等待清除前开始的重建
+        :param record_ids: 记录id列表
+        """
+        r = current_app.redis_cluster
+        try:
+            for batch in chunks(record_ids, constants.REDIS_PIPELINE_BATCH_SIZE):
+                pl = r.pipeline()
+                for record_id in batch:
+                    key = cls.key_format.format(record_id)
+                    pl.delete(key)
+                    pl.delete(RedisLease.lease_key(key))
+                pl.execute()
+        except RedisError as e:
+            current_app.logger.error(e)
+
+        if cls.local_cache is not None:
+            invalidation_bus.invalidate(cls.local_cache.name, record_ids)
+
+    @classmethod
+    def get_many(cls, record_ids):
+        """
+        批量获取记录
+        :param record_ids: 记录id列表
+        :return: dict {record_id: record}, 不存在的记录不在结果中
+        """
+        # 去重并保持顺序
+        record_ids = list(dict.fromkeys(record_ids))
+
+        found = {}
+        if cls.local_cache is not None:
+            remaining = []
+            for record_id in record_ids:
+                record = cls.local_cache.get(record_id)
+                if record is MISSING:
+                    remaining.append(record_id)
+                else:
+                    found[record_id] = record
+        else:
+            remaining = record_ids
+
+        if remaining:
+            fetched, stale = cls._get_many_from_redis(remaining)
+            unresolved = [record_id for record_id in remaining if record_id not in fetched]
+            if unresolved:
+                for record_id, (record, is_fresh) in cls._resolve_many(unresolved, stale).items():
+                    if is_fresh:
+                        fetched[record_id] = record
+                    else:
+                        found[record_id] = record
+
+            if cls.local_cache is not None:
+                for record_id, record in fetched.items():
+                    cls.local_cache.set(record_id, record)
+            found.update(fetched)
+
+        return {record_id: record for record_id, record in found.items() if record is not None}
+
+    @classmethod
+    def _get_many_from_redis(cls, record_ids):
+        """
+        使用pipeline从redis中批量读取
+        :param record_ids: 记录id列表
+        :return: (fetched, stale)
+            fetched: dict {record_id: record or None}, 值为None表示已缓存为不存在
+            stale: dict {record_id: record}, 已逻辑过期或被选中提前刷新的记录
+            未缓存的记录不在结果中
+        """
+        r = current_app.redis_cluster
+        rets = []
+        try:
+            for batch in chunks(record_ids, constants.REDIS_PIPELINE_BATCH_SIZE):
+                pl = r.pipeline()
+                for record_id in batch:
+                    pl.hgetall(cls.key_format.format(record_id))
+                rets.extend(pl.execute())
+        except RedisError as e:
+            current_app.logger.error(e)
+            return {}, {}
+
+        now = time.time()
+        fetched = {}
+        stale = {}
+        for record_id, ret in zip(record_ids, rets):
+            if not ret:
+                continue
+            data = {k.decode(): v.decode() for k, v in ret.items()}
+            if NOT_EXISTS_FIELD in data:
+                fetched[record_id] = None
+                continue
+
+            expire_at = float(data.pop(EXPIRE_AT_FIELD, 'inf'))
+            delta = float(data.pop(DELTA_FIELD, 0))
+            record = cls._from_hash(data)
+            if should_refresh_early(expire_at, delta, now=now):
+                stale[record_id] = record
+            else:
+                fetched[record_id] = record
+        return fetched, stale
+
+    @classmethod
+    def _resolve_many(cls, record_ids, stale):
+        """
+        处理未命中及需要刷新的记录，进程内同一记录只有一个线程处理
+        :param record_ids: 记录id列表
+        :param stale: dict {record_id: record} 可返回的旧数据
+        :return: dict {record_id: (record or None, is_fresh)}
+        """
+        keys = {cls.key_format.format(record_id): record_id for record_id in record_ids}
+
+        def loader(lead_keys):
+            rebuilt = cls._rebuild_many([keys[key] for key in lead_keys], stale)
+            return {cls.key_format.format(record_id): value for record_id, value in rebuilt.items()}
+
+        results = _single_flight.do_many(list(keys), loader)
+        return {keys[key]: value for key, value in results.items() if value is not None}
+
+    @classmethod
+    def _rebuild_many(cls, record_ids, stale):
+        """
+        重建缓存
+        获得租约的记录查询数据库重建，未获得租约的记录返回旧数据，
+        无旧数据时短暂等待其他进程重建，等待超时后再查询数据库
+        :param record_ids: 记录id列表
+        :param stale: dict {record_id: record} 可返回的旧数据
+        :return: dict {record_id: (record or None, is_fresh)}
+        """
+        keys = {cls.key_format.format(record_id): record_id for record_id in record_ids}
+        leased_keys = _lease.acquire_many(list(keys))
+
+        rebuilt = {}
+        if leased_keys:
+            rebuilt.update(cls._load_and_save([keys[key] for key in leased_keys]))
+
+        waiting = []
+        for record_id in record_ids:
+            if record_id in rebuilt:
+                continue
+            if record_id in stale:
+                rebuilt[record_id] = (stale[record_id], False)
+            else:
+                waiting.append(record_id)
+
+        for _ in range(constants.CACHE_LEASE_WAIT_TIMES):
+            if not waiting:
+                break
+            time.sleep(constants.CACHE_LEASE_WAIT_INTERVAL)
+            fetched, fetched_stale = cls._get_many_from_redis(waiting)
+            fetched.update(fetched_stale)
+            for record_id, record in fetched.items():
+                rebuilt[record_id] = (record, True)
+            waiting = [record_id for record_id in waiting if record_id not in fetched]
+
+        if waiting:
+            rebuilt.update(cls._load_and_save(waiting))
+
+        return rebuilt
+
+    @classmethod
+    def _load_and_save(cls, record_ids):
+        """
+        查询数据库并写入缓存
+        :param record_ids: 记录id列表
+        :return: dict {record_id: (record or None, True)}
+        """
+        start = time.time()
+        loaded = cls._load_many(record_ids)
+        delta = time.time() - start
+
+        records = {record_id: loaded.get(record_id) for record_id in record_ids}
+        cls._save_many(records, delta)
+        return {record_id: (record, True) for record_id, record in records.items()}
+
+    @classmethod
+    def _save_many(cls, records, delta=0):
+        """
+        使用pipeline批量写入redis
+        记录的redis有效期比逻辑有效期长CACHE_STALE_GRACE，以便重建期间返回旧数据
+        :param records: dict {record_id: record or None}
+        :param delta: 重建耗时，秒
+        """
+        r = current_app.redis_cluster
+        now = time.time()
+        try:
+            for batch in chunks(list(records.items()), constants.REDIS_PIPELINE_BATCH_SIZE):
+                pl = r.pipeline()
+                for record_id, record in batch:
+                    key = cls.key_format.format(record_id)
+                    pl.delete(key)
+                    if record is None:
+                        pl.hmset(key, {NOT_EXISTS_FIELD: 1})
+                        pl.expire(key, cls.not_exists_ttl.get_val())
+                    else:
+                        ttl = cls.ttl.get_val()
+                        data = cls._to_hash(record)
+                        data[EXPIRE_AT_FIELD] = now + ttl
+                        data[DELTA_FIELD] = delta
+                        pl.hmset(key, data)
+                        pl.expire(key, ttl + constants.CACHE_STALE_GRACE)
+                pl.execute()
+        except RedisError as e:
+            current_app.logger.error(e)
+
+    @classmethod
+    def _load_many(cls, record_ids):
+        """
+        从数据库批量查询，由子类实现
+        :param record_ids: 记录id列表
+        :return: dict {record_id: record}
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def _to_hash(cls, record):
+        """
+        记录转换为redis hash的字段，由子类实现
+        :param record: dict
+        :return: dict
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def _from_hash(cls, data):
+        """
+        redis hash的字段转换为记录，由子类实现
+        :param data: dict 已解码的hash字段
+        :return: dict
+        """
+        raise NotImplementedError
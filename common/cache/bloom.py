@@ -0,0 +1,261 @@
+import math
+import hashlib
+import threading
+from flask import current_app
+from redis.exceptions import RedisError
+
+from models.user import User
+from . import constants
+from .base import chunks
+from .invalidation import invalidation_bus
+
+
+def bloom_params(capacity, error_rate):
+    """
+    计算布隆过滤器参数
+    :param capacity: 预计元素数量
+    :param error_rate: 期望误判率
+    :return: (size, hash_count) 位数（8的整数倍）与哈希函数数量
+    """
+    size = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+    size = (size + 7) // 8 * 8
+    hash_count = max(1, int(round(size / capacity * math.log(2))))
+    return size, hash_count
+
+
+def bloom_positions(item, size, hash_count):
+    """
+    计算元素对应的位，使用双重哈希
+    :param item: 元素
+    :param size: 位数
+    :param hash_count: 哈希函数数量
+    :return: list
+    """
+    digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [(h1 + i * h2) % size for i in range(hash_count)]
+
+
+class BloomFilter(object):
+    """
+    布隆过滤器
+    位顺序与redis SETBIT/GETBIT一致（每个字节高位在前），可直接使用redis位图数据
+    """
+    def __init__(self, capacity, error_rate, data=None):
+        """
+        初始化
+        :param capacity: 预计元素数量
+        :param error_rate: 期望误判率
+        :param data: bytes 位图数据
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size, self.hash_count = bloom_params(capacity, error_rate)
+
+        self.data = bytearray(self.size // 8)
+        if data:
+            self.data[:len(data)] = data[:len(self.data)]
+
+    def add(self, item):
+        for pos in bloom_positions(item, self.size, self.hash_count):
+            self.data[pos >> 3] |= 0x80 >> (pos & 7)
+
+    def __contains__(self, item):
+        data = self.data
+        for pos in bloom_positions(item, self.size, self.hash_count):
+            if not data[pos >> 3] & (0x80 >> (pos & 7)):
+                return False
+        return True
+
+
+class RedisBloomFilter(object):
+    """
+    redis位图保存的布隆过滤器，每个进程保存一份本地只读镜像
+    查询只访问本地镜像，新增时写入redis并通过invalidation_bus通知所有进程更新镜像，
+    镜像由定时任务定期从redis全量同步
+    """
+    def __init__(self, name, capacity, error_rate, load_ids):
+        """
+        初始化
+        :param name: 名称
+        :param capacity: 预计元素数量
+        :param error_rate: 期望误判率
+        :param load_ids: 从数据库按id升序分页查询的函数，参数为(after_id, limit)，返回id列表
+        """
+        self.key = 'bloom:{}'.format(name)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size, self.hash_count = bloom_params(capacity, error_rate)
+        self.load_ids = load_ids
+
+        self._local = None
+        self._lock = threading.Lock()
+        self._syncing_items = None
+
+        invalidation_bus.add_handler(self.key, self._add_local, self._reset_local)
+
+    def might_contain(self, item):
+        """
+        判断元素是否可能存在，不访问网络
+        本地镜像未同步时返回True，由调用方继续检查
+        :param item: 元素
+        :return: bool 为False时一定不存在
+        """
+        local = self._local
+        if local is None:
+            return True
+        return item in local
+
+    def add_many(self, items):
+        """
+        新增元素
+        :param items: 元素列表
+        """
+        if not items:
+            return
+
+        pl = current_app.redis_master.pipeline(transaction=False)
+        for item in items:
+            for pos in bloom_positions(item, self.size, self.hash_count):
+                pl.setbit(self.key, pos, 1)
+        try:
+            pl.execute()
+        except RedisError as e:
+            current_app.logger.error(e)
+
+        invalidation_bus.invalidate(self.key, list(items))
+
+    def _add_local(self, items):
+        with self._lock:
+            if self._syncing_items is not None:
+                self._syncing_items.extend(items)
+            if self._local is not None:
+                for item in items:
+                    self._local.add(item)
+
+    def _reset_local(self):
+        self._local = None
+
+    def sync(self):
+        """
+        从redis全量同步本地镜像
+        """
+        with self._lock:
+            self._syncing_items = []
+
+        try:
+            data = current_app.redis_master.get(self.key)
+        except RedisError as e:
+            current_app.logger.error(e)
+            data = None
+
+        with self._lock:
+            items, self._syncing_items = self._syncing_items, None
+            if data is None:
+                return
+            local = BloomFilter(self.capacity, self.error_rate, data)
+            for item in items:
+                local.add(item)
+            self._local = local
+
+    def rebuild(self):
+        """
+        从数据库重建，需使用主库
+        在本地生成完整位图后与redis中的位图按位或合并，重建期间通过add_many新增的id不会丢失，
+        再补充重建期间新增但未调用add_many的id
+        :return: int 元素数量
+        """
+        local = BloomFilter(self.capacity, self.error_rate)
+        count = 0
+        after_id = 0
+        while True:
+            ids = self.load_ids(after_id, constants.BLOOM_FILTER_REBUILD_BATCH_SIZE)
+            if not ids:
+                break
+            for _id in ids:
+                local.add(_id)
+            count += len(ids)
+            after_id = ids[-1]
+
+        r = current_app.redis_master
+        tmp_key = '{}:tmp'.format(self.key)
+        pl = r.pipeline(transaction=True)
+        pl.set(tmp_key, bytes(local.data))
+        pl.bitop('OR', self.key, self.key, tmp_key)
+        pl.delete(tmp_key)
+        pl.execute()
+
+        while True:
+            ids = self.load_ids(after_id, constants.BLOOM_FILTER_REBUILD_BATCH_SIZE)
+            if not ids:
+                break
+            for batch in chunks(ids, constants.REDIS_PIPELINE_BATCH_SIZE):
+                self.add_many(batch)
+            count += len(ids)
+            after_id = ids[-1]
+
+        return count
+
+
+def _load_ids(column):
+    """
+    生成按id升序分页查询的函数
+    :param column: id列
+    """
+    def load_ids(after_id, limit):
+        rows = column.class_.query.with_entities(column).filter(column > after_id) \
+            .order_by(column).limit(limit).all()
+        return [row[0] for row in rows]
+    return load_ids
+
+
+user_bloom_filter = RedisBloomFilter('user', constants.USER_BLOOM_FILTER_CAPACITY,
+                                     constants.BLOOM_FILTER_ERROR_RATE, _load_ids(User.id))
+
+ALL_BLOOM_FILTERS = (user_bloom_filter,)
+
+
+if __name__ == '__main__':
+    # 误判率测试，使用Snowflake IdWorker的id分布
+    # 在common目录下执行 python -m cache.bloom
+    import time
+    import random
+    from utils.snowflake.id_worker import TWEPOCH, TIMESTAMP_LEFT_SHIFT, DATACENTER_ID_SHIFT, WOKER_ID_SHIFT
+
+    def snowflake_id(timestamp, datacenter_id, worker_id, sequence):
+        return ((timestamp - TWEPOCH) << TIMESTAMP_LEFT_SHIFT) | (datacenter_id << DATACENTER_ID_SHIFT) | \
+               (worker_id << WOKER_ID_SHIFT) | sequence
+
+    capacity = 1000000
+    now = int(time.time() * 1000)
+    start = now - 2 * 365 * 24 * 3600 * 1000
+
+    # 两年内注册的用户，集中在少量worker上，同一毫秒内序号较小
+    existing = set()
+    while len(existing) < capacity:
+        existing.add(snowflake_id(random.randrange(start, now), 0, random.randrange(4), random.randrange(3)))
+
+    bf = BloomFilter(capacity, constants.BLOOM_FILTER_ERROR_RATE)
+    begin = time.perf_counter()
+    for _id in existing:
+        bf.add(_id)
+    add_cost = time.perf_counter() - begin
+
+    probes = {
+        # 相邻序号，模拟遍历id
+        'adjacent': [_id + 1 for _id in random.sample(list(existing), 100000)],
+        # 同一时间范围内的随机id
+        'random': [snowflake_id(random.randrange(start, now), 0, random.randrange(32), random.randrange(4096))
+                   for _ in range(100000)],
+    }
+
+    print('capacity={} error_rate={} size={}bits({:.1f}MB) hash_count={} add={:.2f}us/op'.format(
+        capacity, bf.error_rate, bf.size, bf.size / 8 / 1024 / 1024, bf.hash_count, add_cost / capacity * 1e6))
+    for name, ids in probes.items():
+        ids = [_id for _id in ids if _id not in existing]
+        begin = time.perf_counter()
+        false_positives = sum(1 for _id in ids if _id in bf)
+        cost = time.perf_counter() - begin
+        print('{}: false_positive_rate={:.4%} check={:.2f}us/op'.format(
+            name, false_positives / len(ids), cost / len(ids) * 1e6))
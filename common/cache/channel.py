@@ -0,0 +1,144 @@
+import time
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+from flask import current_app
+from redis.exceptions import RedisError
+from sqlalchemy.orm import load_only
+from sqlalchemy.exc import DatabaseError
+
+from models.news import Channel
+from . import constants
+
+
+# 频道数据，不可变
+ChannelItem = namedtuple('ChannelItem', ('id', 'name', 'sequence', 'is_visible', 'is_default'))
+
+
+class ChannelsSnapshot(object):
+    """
+    全部频道数据的不可变快照
+    """
+    __slots__ = ('version', 'channels', 'by_id', 'visible', 'default')
+
+    def __init__(self, version, channels):
+        """
+        初始化
+        :param version: 版本号
+        :param channels: 按序号排列的ChannelItem列表
+        """
+        self.version = version
+        self.channels = tuple(channels)
+        self.by_id = MappingProxyType({channel.id: channel for channel in self.channels})
+        self.visible = tuple(channel for channel in self.channels if channel.is_visible)
+        self.default = tuple(channel for channel in self.visible if channel.is_default)
+
+
+class AllChannelsCache(object):
+    """
+    全部频道缓存
+    频道数据保存为进程内不可变快照，查询只访问本地字典；
+    每隔CHANNELS_VERSION_CHECK_INTERVAL秒检查一次redis中的版本号，版本变化时才重新查询数据库
+    """
+    version_key = 'ch:all:version'
+
+    _snapshot = None
+    _checked_at = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def _get_version(cls):
+        """
+        获取redis中的版本号
+        :return: int or None 获取失败时返回None
+        """
+        try:
+            version = current_app.redis_cluster.get(cls.version_key)
+        except RedisError as e:
+            current_app.logger.error(e)
+            return None
+        return int(version) if version else 0
+
+    @classmethod
+    def _load(cls, version):
+        """
+        查询数据库生成快照
+        :param version: 版本号
+        :return: ChannelsSnapshot
+        """
+        try:
+            channels = Channel.query.options(load_only(
+                Channel.id,
+                Channel.name,
+                Channel.sequence,
+                Channel.is_visible,
+                Channel.is_default
+            )).order_by(Channel.sequence, Channel.id).all()
+        except DatabaseError as e:
+            current_app.logger.error(e)
+            raise e
+
+        return ChannelsSnapshot(version, [
+            ChannelItem(channel.id, channel.name, channel.sequence, bool(channel.is_visible), bool(channel.is_default))
+            for channel in channels
+        ])
+
+    @classmethod
+    def snapshot(cls):
+        """
+        获取当前快照
+        :return: ChannelsSnapshot
+        """
+        snapshot = cls._snapshot
+        if snapshot is not None and time.monotonic() - cls._checked_at < constants.CHANNELS_VERSION_CHECK_INTERVAL:
+            return snapshot
+
+        with cls._lock:
+            snapshot = cls._snapshot
+            if snapshot is not None and time.monotonic() - cls._checked_at < constants.CHANNELS_VERSION_CHECK_INTERVAL:
+                return snapshot
+
+            version = cls._get_version()
+            if snapshot is None or (version is not None and version != snapshot.version):
+                snapshot = cls._load(version)
+                cls._snapshot = snapshot
+            cls._checked_at = time.monotonic()
+
+        return snapshot
+
+    @classmethod
+    def get(cls):
+        """
+        获取所有可见频道
+        :return: tuple of ChannelItem
+        """
+        return cls.snapshot().visible
+
+    @classmethod
+    def get_default(cls):
+        """
+        获取默认频道
+        :return: tuple of ChannelItem
+        """
+        return cls.snapshot().default
+
+    @classmethod
+    def exists(cls, channel_id):
+        """
+        判断频道是否存在且可见
+        :param channel_id: 频道id
+        :return: bool
+        """
+        channel = cls.snapshot().by_id.get(channel_id)
+        return channel is not None and channel.is_visible
+
+    @classmethod
+    def clear(cls):
+        """
+        频道数据修改后调用，增加版本号使所有进程重新加载
+        """
+        try:
+            current_app.redis_cluster.incr(cls.version_key)
+        except RedisError as e:
+            current_app.logger.error(e)
+        cls._checked_at = 0
@@ -0,0 +1,296 @@
+from flask import current_app
+from redis.exceptions import RedisError
+from sqlalchemy.orm import load_only
+from sqlalchemy.exc import DatabaseError
+
+from models.news import Comment
+from . import constants
+from .base import RecordHashCache, chunks
+from .user import UserProfileCache
+
+
+class CommentCache(RecordHashCache):
+    """
+    评论信息缓存
+    """
+    key_format = 'comm:{}'
+    ttl = constants.CommentCacheTTL
+    not_exists_ttl = constants.CommentNotExistsCacheTTL
+
+    @classmethod
+    def _load_many(cls, comment_ids):
+        """
+        从数据库批量查询评论，作者信息从用户资料缓存批量获取
+        :param comment_ids: 评论id列表
+        :return: dict {comment_id: comment}
+        """
+        try:
+            comments = Comment.query.options(load_only(
+                Comment.id,
+                Comment.user_id,
+                Comment.like_count,
+                Comment.reply_count,
+                Comment.content,
+                Comment.is_top,
+                Comment.ctime
+            )).filter(Comment.id.in_(comment_ids), Comment.status == Comment.STATUS.APPROVED).all()
+        except DatabaseError as e:
+            current_app.logger.error(e)
+            raise e
+
+        authors = UserProfileCache.get_many([comment.user_id for comment in comments])
+
+        ret = {}
+        for comment in comments:
+            author = authors.get(comment.user_id) or {}
+            ret[comment.id] = {
+                'com_id': comment.id,
+                'aut_id': comment.user_id,
+                'aut_name': author.get('name', ''),
+                'aut_photo': author.get('photo', ''),
+                'like_count': comment.like_count,
+                'reply_count': comment.reply_count,
+                'pubdate': comment.ctime.strftime('%Y-%m-%d %H:%M:%S'),
+                'content': comment.content,
+                'is_top': bool(comment.is_top),
+            }
+        return ret
+
+    @classmethod
+    def _to_hash(cls, record):
+        data = dict(record)
+        data['is_top'] = 1 if record['is_top'] else 0
+        return data
+
+    @classmethod
+    def _from_hash(cls, data):
+        data['com_id'] = int(data['com_id'])
+        data['aut_id'] = int(data['aut_id'])
+        data['like_count'] = int(data['like_count'])
+        data['reply_count'] = int(data['reply_count'])
+        data['is_top'] = data.get('is_top') == '1'
+        return data
+
+
+class CommentsListCacheBase(object):
+    """
+    评论id列表缓存基类
+    zset保存最新的COMMENTS_LIST_CACHE_WINDOW条评论id（分数同为评论id，按时间倒序即按id倒序），
+    figure hash保存评论总数count与是否还有更早的评论more，
+    分页使用评论id作为游标，翻过缓存的评论后查询数据库
+    发表评论后调用add更新缓存，删除或审核评论后调用clear
+    zset与figure的键名使用相同的hash tag，位于集群的同一slot，由lua脚本原子更新
+    """
+    # redis键格式，由子类设置
+    key_format = ''
+    figure_key_format = ''
+
+    # figure存在时（缓存有效）添加评论id，超出缓存数量时去掉最早的评论，并重设有效期
+    # KEYS: zset, figure  ARGV: 评论id, 缓存数量, 有效期
+    ADD_SCRIPT = """
+    if redis.call('exists', KEYS[2]) == 0 then
+        return 0
+    end
+    if redis.call('zadd', KEYS[1], ARGV[1], ARGV[1]) == 0 then
+        return 0
+    end
+    redis.call('hincrby', KEYS[2], 'count', 1)
+    if redis.call('zremrangebyrank', KEYS[1], 0, -tonumber(ARGV[2]) - 1) > 0 then
+        redis.call('hset', KEYS[2], 'more', 1)
+    end
+    redis.call('expire', KEYS[1], ARGV[3])
+    redis.call('expire', KEYS[2], ARGV[3])
+    return 1
+    """
+
+    _add_script = None
+
+    def __init__(self, target_id):
+        self.target_id = target_id
+        self.key = self.key_format.format(target_id)
+        self.figure_key = self.figure_key_format.format(target_id)
+
+    def _query(self):
+        """
+        评论的查询条件，由子类实现
+        :return: Query
+        """
+        raise NotImplementedError
+
+    def _load_ids(self, cursor=None, limit=constants.COMMENTS_LIST_CACHE_WINDOW):
+        """
+        从数据库查询评论id，按id倒序
+        :param cursor: 只查询id小于cursor的评论，为None时从最新的评论开始
+        :param limit: 数量
+        :return: list
+        """
+        query = self._query().options(load_only(Comment.id))
+        if cursor:
+            query = query.filter(Comment.id < cursor)
+        try:
+            comments = query.order_by(Comment.id.desc()).limit(limit).all()
+        except DatabaseError as e:
+            current_app.logger.error(e)
+            raise e
+
+        return [comment.id for comment in comments]
+
+    def _load(self):
+        """
+        从数据库查询最新的评论id与评论总数，并保存缓存
+        :return: (comment_ids, more, total_count)
+        """
+        window = constants.COMMENTS_LIST_CACHE_WINDOW
+        comment_ids = self._load_ids(limit=window + 1)
+        more = len(comment_ids) > window
+        if more:
+            comment_ids = comment_ids[:window]
+            try:
+                total_count = self._query().count()
+            except DatabaseError as e:
+                current_app.logger.error(e)
+                raise e
+        else:
+            total_count = len(comment_ids)
+
+        self._save(comment_ids, more, total_count)
+        return comment_ids, more, total_count
+
+    def get_page(self, cursor=None, limit=10):
+        """
+        获取一页评论
+        :param cursor: 游标，上一页最后一条评论的id，为None时从最新的评论开始
+        :param limit: 每页数量
+        :return: (comments, next_cursor, total_count)
+            next_cursor为None表示没有更多数据
+        """
+        max_score = '({}'.format(cursor) if cursor else '+inf'
+
+        r = current_app.redis_cluster
+        try:
+            pl = r.pipeline()
+            pl.zrevrangebyscore(self.key, max_score, '-inf', start=0, num=limit + 1)
+            pl.hgetall(self.figure_key)
+            ret_ids, figure = pl.execute()
+        except RedisError as e:
+            current_app.logger.error(e)
+            ret_ids, figure = [], None
+
+        if figure:
+            comment_ids = [int(comment_id) for comment_id in ret_ids]
+            more = figure.get(b'more') == b'1'
+            total_count = int(figure[b'count'])
+        else:
+            comment_ids, more, total_count = self._load()
+            if cursor:
+                comment_ids = [comment_id for comment_id in comment_ids if comment_id < cursor]
+            comment_ids = comment_ids[:limit + 1]
+
+        # 缓存的评论不足一页且还有更早的评论时，从数据库查询剩余部分
+        if len(comment_ids) <= limit and more:
+            last_id = comment_ids[-1] if comment_ids else cursor
+            comment_ids.extend(self._load_ids(last_id, limit + 1 - len(comment_ids)))
+
+        has_next = len(comment_ids) > limit
+        comment_ids = comment_ids[:limit]
+
+        comments = CommentCache.get_many(comment_ids)
+        page = [comments[comment_id] for comment_id in comment_ids if comment_id in comments]
+
+        next_cursor = comment_ids[-1] if has_next else None
+        return page, next_cursor, total_count
+
+    def count(self):
+        """
+        获取评论总数
+        :return: int
+        """
+        r = current_app.redis_cluster
+        try:
+            count = r.hget(self.figure_key, 'count')
+        except RedisError as e:
+            current_app.logger.error(e)
+            count = None
+
+        if count is not None:
+            return int(count)
+
+        _, _, total_count = self._load()
+        return total_count
+
+    def _save(self, comment_ids, more, total_count):
+        """
+        保存评论id列表及统计数据
+        :param comment_ids: 按id倒序的评论id列表
+        :param more: 是否还有更早的评论
+        :param total_count: 评论总数
+        """
+        r = current_app.redis_cluster
+        ttl = constants.CommentsListCacheTTL.get_val()
+        figure = {'count': total_count, 'more': 1 if more else 0}
+        try:
+            pl = r.pipeline()
+            pl.delete(self.key)
+            for batch in chunks(comment_ids, constants.REDIS_PIPELINE_BATCH_SIZE):
+                args = []
+                for comment_id in batch:
+                    args.extend((comment_id, comment_id))
+                pl.zadd(self.key, *args)
+            pl.expire(self.key, ttl)
+            pl.hmset(self.figure_key, figure)
+            pl.expire(self.figure_key, ttl)
+            pl.execute()
+        except RedisError as e:
+            current_app.logger.error(e)
+
+    def add(self, comment_id):
+        """
+        发表评论（审核通过）后更新缓存，缓存不存在时不处理，超出缓存数量时去掉最早的评论
+        :param comment_id: 评论id
+        """
+        r = current_app.redis_cluster
+        cls = type(self)
+        try:
+            if cls._add_script is None:
+                cls._add_script = r.register_script(self.ADD_SCRIPT)
+            cls._add_script(keys=[self.key, self.figure_key],
+                            args=[comment_id, constants.COMMENTS_LIST_CACHE_WINDOW,
+                                  constants.CommentsListCacheTTL.get_val()],
+                            client=r)
+        except RedisError as e:
+            current_app.logger.error(e)
+            self.clear()
+
+    def clear(self):
+        """
+        清除缓存
+        """
+        try:
+            current_app.redis_cluster.delete(self.key, self.figure_key)
+        except RedisError as e:
+            current_app.logger.error(e)
+
+
+class ArticleCommentsCache(CommentsListCacheBase):
+    """
+    文章评论列表缓存
+    """
+    key_format = 'art:{{{}}}:comm'
+    figure_key_format = 'art:{{{}}}:comm:figure'
+
+    def _query(self):
+        return Comment.query.filter(Comment.article_id == self.target_id,
+                                    Comment.parent_id.is_(None),
+                                    Comment.status == Comment.STATUS.APPROVED)
+
+
+class CommentRepliesCache(CommentsListCacheBase):
+    """
+    评论回复列表缓存
+    """
+    key_format = 'comm:{{{}}}:reply'
+    figure_key_format = 'comm:{{{}}}:reply:figure'
+
+    def _query(self):
+        return Comment.query.filter(Comment.parent_id == self.target_id,
+                                    Comment.status == Comment.STATUS.APPROVED)
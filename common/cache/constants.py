@@ -0,0 +1,181 @@
+import random
+
+
+class BaseCacheTTL(object):
+    """
+    缓存有效期
+    为防止缓存雪崩，在设置缓存有效期时采用设置不同有效期的方案，通过增加随机值实现
+    """
+    TTL = 0  # 由子类设置
+    MAX_DELTA = 10 * 60  # 随机的增量上限
+
+    @classmethod
+    def get_val(cls):
+        return cls.TTL + random.randrange(0, cls.MAX_DELTA)
+
+
+class UserProfileCacheTTL(BaseCacheTTL):
+    """
+    用户资料数据缓存时间, 秒
+    """
+    TTL = 30 * 60
+
+
+class UserMobileCacheTTL(BaseCacheTTL):
+    """
+    手机号对应用户的缓存时间, 秒
+    """
+    TTL = 24 * 60 * 60
+
+
+class UserNotExistsCacheTTL(BaseCacheTTL):
+    """
+    不存在的用户缓存时间, 秒
+    """
+    TTL = 5 * 60
+    MAX_DELTA = 60
+
+
+class ArticleInfoCacheTTL(BaseCacheTTL):
+    """
+    文章信息缓存时间, 秒
+    """
+    TTL = 30 * 60
+
+
+class ArticleNotExistsCacheTTL(BaseCacheTTL):
+    """
+    不存在的文章缓存时间, 秒
+    """
+    TTL = 5 * 60
+    MAX_DELTA = 60
+
+
+class CommentCacheTTL(BaseCacheTTL):
+    """
+    评论信息缓存时间, 秒
+    """
+    TTL = 30 * 60
+
+
+class CommentNotExistsCacheTTL(BaseCacheTTL):
+    """
+    不存在的评论缓存时间, 秒
+    """
+    TTL = 5 * 60
+    MAX_DELTA = 60
+
+
+class CommentsListCacheTTL(BaseCacheTTL):
+    """
+    文章评论列表、评论回复列表缓存时间, 秒
+    """
+    TTL = 30 * 60
+
+
+class ArticleDetailCacheTTL(BaseCacheTTL):
+    """
+    文章详情内容缓存时间, 秒
+    """
+    TTL = 60 * 60
+
+
+class AnnouncementDetailCacheTTL(BaseCacheTTL):
+    """
+    系统公告详细信息缓存时间, 秒
+    """
+    TTL = 2 * 60 * 60
+
+
+class AnnouncementNotExistsCacheTTL(BaseCacheTTL):
+    """
+    不存在的公告缓存时间, 秒
+    """
+    TTL = 5 * 60
+    MAX_DELTA = 60
+
+
+# redis pipeline每批次的命令数量
+REDIS_PIPELINE_BATCH_SIZE = 100
+
+# 进程内用户资料缓存的最大条目数
+USER_PROFILE_LOCAL_CACHE_MAX_SIZE = 10000
+
+# 进程内用户资料缓存有效期, 秒
+USER_PROFILE_LOCAL_CACHE_TTL = 60
+
+# 缓存逻辑过期后仍保留在redis中的时间，用于重建期间返回旧数据, 秒
+CACHE_STALE_GRACE = 60
+
+# 缓存重建租约有效期, 毫秒
+CACHE_LEASE_TTL = 2000
+
+# 未获得租约时等待其他进程重建缓存的轮询间隔, 秒
+CACHE_LEASE_WAIT_INTERVAL = 0.05
+
+# 未获得租约时等待其他进程重建缓存的轮询次数
+CACHE_LEASE_WAIT_TIMES = 3
+
+# 概率提前刷新系数
+CACHE_EARLY_REFRESH_BETA = 1.0
+
+# 进程内等待其他线程加载的超时时间, 秒
+SINGLE_FLIGHT_WAIT_TIMEOUT = 3
+
+# 进程内缓存失效通知的redis发布订阅频道
+INVALIDATION_CHANNEL = 'cache:invalidation'
+
+# 失效通知订阅断开后的重连间隔, 秒
+INVALIDATION_RECONNECT_INTERVAL = 1
+
+# 统计数据修正时每批从数据库统计的数据数量
+STATISTIC_RECONCILE_BATCH_SIZE = 1000
+
+# 用户阅读历史保存的最大数量
+READING_HISTORY_MAX_COUNT = 100
+
+# 待持久化的阅读记录队列最大长度，超出时丢弃最早的记录
+READING_HISTORY_QUEUE_MAX_LENGTH = 1000000
+
+# 每批持久化的阅读记录数量
+READING_HISTORY_PERSIST_BATCH_SIZE = 1000
+
+# 写入失败的阅读记录死信队列最大长度
+READING_HISTORY_DEAD_LETTER_MAX_LENGTH = 100000
+
+# 进程内频道数据检查版本号的间隔, 秒
+CHANNELS_VERSION_CHECK_INTERVAL = 5
+
+# 布隆过滤器容量与误判率
+USER_BLOOM_FILTER_CAPACITY = 10000000
+BLOOM_FILTER_ERROR_RATE = 0.01
+
+# 重建布隆过滤器时每批从数据库查询的id数量
+BLOOM_FILTER_REBUILD_BATCH_SIZE = 10000
+
+# 已撤销token布隆过滤器镜像的容量
+TOKEN_REVOCATION_BLOOM_CAPACITY = 1000000
+
+# 短信验证码允许的最大错误次数，超过后锁定手机号
+SMS_VERIFICATION_MAX_ATTEMPTS = 5
+
+# 短信验证码错误次数的统计时长与锁定时长, 秒
+SMS_VERIFICATION_LOCK_EXPIRES = 30 * 60
+
+# 点赞、收藏等用户操作的写入流最大长度，超出时丢弃最早的记录
+INTERACTION_STREAM_MAX_LENGTH = 1000000
+
+# 每批持久化的用户操作数量
+INTERACTION_PERSIST_BATCH_SIZE = 1000
+
+# 用户操作读取后超过此时间未确认时由其他进程重新处理（如进程崩溃）, 毫秒
+INTERACTION_PENDING_CLAIM_IDLE = 60 * 1000
+
+# 用户操作的最大投递次数，超过后移入死信流，不再重试
+INTERACTION_MAX_DELIVERIES = 30
+
+# 用户操作死信流最大长度
+INTERACTION_DEAD_LETTER_MAX_LENGTH = 100000
+
+# 评论id列表缓存的最新评论数量，更早的评论分页时查询数据库
+COMMENTS_LIST_CACHE_WINDOW = 1000
@@ -0,0 +1,309 @@
+import os
+import socket
+from datetime import datetime
+from flask import current_app
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.mysql import insert
+
+from models.news import Attitude, Collection, CommentLiking
+from . import constants
+
+
+class InteractionStorageBase(object):
+    """
+    点赞、收藏等高频用户操作的延迟写入
+    请求中只将操作追加到redis流（一次网络往返），由定时任务批量读取，
+    合并同一用户对同一目标的多次操作后使用 INSERT ... ON DUPLICATE KEY UPDATE 批量写入数据库
+    """
+    stream_key = 'interaction:stream'
+    group = 'persist'
+    # 无法写入数据库的操作，保留原始字段与原因，便于排查后重新写入
+    dead_letter_key = 'interaction:dead'
+
+    # 操作类型，写入流中，由子类设置
+    kind = ''
+
+    # 数据库模型与目标id字段，由子类设置
+    model = None
+    target_field = ''
+
+    @classmethod
+    def save(cls, user_id, target_id, value, increments=()):
+        """
+        保存用户操作，与统计值的修改在同一次网络往返中完成
+        :param user_id: 用户id
+        :param target_id: 目标id
+        :param value: 操作后的状态，由子类定义
+        :param increments: list [(CountStorage子类, target_id, increment)] 同时修改的统计值
+        """
+        # 同时记录修改的统计值，修正统计数据时跳过尚未写入数据库的目标
+        counts = ','.join('{} {}'.format(storage.key, count_target_id) for storage, count_target_id, _ in increments)
+        pl = current_app.redis_master.pipeline(transaction=False)
+        pl.execute_command('XADD', cls.stream_key, 'MAXLEN', '~', constants.INTERACTION_STREAM_MAX_LENGTH, '*',
+                           'k', cls.kind, 'u', user_id, 't', target_id, 'v', cls._encode(value), 'c', counts)
+        for storage, count_target_id, increment in increments:
+            pl.zincrby(storage.key, count_target_id, increment)
+        try:
+            pl.execute()
+        except RedisError as e:
+            current_app.logger.error(e)
+            raise e
+
+    @classmethod
+    def pending_count_targets(cls, r):
+        """
+        查询尚未写入数据库的操作修改的统计值
+        已写入数据库的操作会从流中删除，流中剩余的均未写入
+        :param r: redis客户端
+        :return: dict {统计值redis键: set(target_id)}
+        """
+        targets = {}
+        start = '-'
+        while True:
+            entries = r.execute_command('XRANGE', cls.stream_key, start, '+',
+                                        'COUNT', constants.INTERACTION_PERSIST_BATCH_SIZE)
+            if not entries:
+                break
+            for _, fields in entries:
+                fields = dict(zip(fields[::2], fields[1::2]))
+                for count in filter(None, fields.get(b'c', b'').decode().split(',')):
+                    key, target_id = count.split(' ')
+                    targets.setdefault(key, set()).add(int(target_id))
+            if len(entries) < constants.INTERACTION_PERSIST_BATCH_SIZE:
+                break
+            # 从最后一条的下一个id继续
+            timestamp, sequence = entries[-1][0].decode().split('-')
+            start = '{}-{}'.format(timestamp, int(sequence) + 1)
+        return targets
+
+    @classmethod
+    def _encode(cls, value):
+        return 1 if value else 0
+
+    @classmethod
+    def _values(cls, value):
+        """
+        由流中的状态生成数据库字段
+        :param value: str
+        :return: dict
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def upsert_statement(cls, rows):
+        """
+        生成批量写入语句
+        同一用户对同一目标的旧操作（如崩溃后重新处理）不覆盖较新的状态
+        :param rows: list [dict]
+        """
+        table = cls.model.__table__
+        stmt = insert(table).values(rows)
+        inserted_time = literal_column('VALUES(update_time)')
+        fixed = (cls.model.__mapper__.primary_key[0].name, 'user_id', cls.target_field, 'create_time', 'update_time')
+        updates = {
+            name: func.IF(inserted_time >= table.c.update_time, literal_column('VALUES({})'.format(name)),
+                          table.c[name])
+            for name in rows[0] if name not in fixed
+        }
+        # MySQL按表字段顺序赋值，update_time在状态字段之后，比较时使用的是修改前的值
+        updates['update_time'] = func.GREATEST(table.c.update_time, inserted_time)
+        return stmt.on_duplicate_key_update(**updates)
+
+    @classmethod
+    def row(cls, user_id, target_id, value, timestamp):
+        """
+        生成写入数据库的一行数据
+        """
+        action_time = datetime.fromtimestamp(timestamp)
+        row = {
+            # 分片表的主键由snowflake生成，已存在时不修改
+            cls.model.__mapper__.primary_key[0].name: current_app.id_worker.get_id(),
+            'user_id': user_id,
+            cls.target_field: target_id,
+            'create_time': action_time,
+            'update_time': action_time,
+        }
+        row.update(cls._values(value))
+        return row
+
+
+class ArticleAttitudeStorage(InteractionStorageBase):
+    """
+    文章点赞、不喜欢
+    状态为 Attitude.ATTITUDE.LIKING / Attitude.ATTITUDE.DISLIKE，取消时为None
+    """
+    kind = 'att'
+    model = Attitude
+    target_field = 'article_id'
+
+    @classmethod
+    def _encode(cls, value):
+        return '' if value is None else int(value)
+
+    @classmethod
+    def _values(cls, value):
+        return {'attitude': int(value) if value else None}
+
+
+class ArticleCollectionStorage(InteractionStorageBase):
+    """
+    文章收藏
+    状态为True收藏，False取消收藏
+    """
+    kind = 'coll'
+    model = Collection
+    target_field = 'article_id'
+
+    @classmethod
+    def _values(cls, value):
+        return {'is_deleted': value != '1'}
+
+
+class CommentLikingStorage(InteractionStorageBase):
+    """
+    评论点赞
+    状态为True点赞，False取消点赞
+    """
+    kind = 'cliking'
+    model = CommentLiking
+    target_field = 'comment_id'
+
+    @classmethod
+    def _values(cls, value):
+        return {'is_deleted': value != '1'}
+
+
+STORAGES = {storage.kind: storage for storage in (ArticleAttitudeStorage, ArticleCollectionStorage,
+                                                  CommentLikingStorage)}
+
+
+class InteractionStream(object):
+    """
+    用户操作流的消费者，使用消费组，多个进程同时读取时不会重复，
+    确认前进程崩溃的操作在超时后由其他进程重新读取
+    """
+    def __init__(self, r):
+        self.r = r
+        self.consumer = '{}:{}'.format(socket.gethostname(), os.getpid())
+        self._group_created = False
+
+    def read(self, count):
+        """
+        读取用户操作，优先重新读取超时未确认的操作
+        :param count: 数量
+        :return: list [(entry_id, kind, user_id, target_id, value, timestamp)] 按写入顺序排列
+        """
+        self._create_group()
+
+        entries, dead_ids = self._claim_pending(count)
+        if len(entries) < count:
+            ret = self.r.execute_command('XREADGROUP', 'GROUP', InteractionStorageBase.group, self.consumer,
+                                         'COUNT', count - len(entries), 'STREAMS',
+                                         InteractionStorageBase.stream_key, '>')
+            if ret:
+                entries.extend(ret[0][1])
+
+        records = []
+        acked = []
+        for entry_id, fields in entries:
+            if not fields:
+                acked.append(entry_id)
+                continue
+            fields = dict(zip(fields[::2], fields[1::2]))
+            entry_id = entry_id.decode()
+            timestamp = int(entry_id.split('-')[0]) / 1000
+            records.append((entry_id, fields[b'k'].decode(), int(fields[b'u']), int(fields[b't']),
+                            fields[b'v'].decode(), timestamp))
+        if acked:
+            self.ack(acked)
+
+        # 多次投递仍未写入的操作（如数据错误）移入死信流，避免一直重试并阻塞其后的操作
+        dead = [record for record in records if record[0] in dead_ids]
+        if dead:
+            self.dead_letter(dead, 'too many deliveries')
+            records = [record for record in records if record[0] not in dead_ids]
+
+        records.sort(key=lambda record: tuple(int(part) for part in record[0].split('-')))
+        return records
+
+    def dead_letter(self, records, reason):
+        """
+        将操作移入死信流并确认
+        :param records: list [(entry_id, kind, user_id, target_id, value, timestamp)]
+        :param reason: 原因
+        """
+        pl = self.r.pipeline(transaction=False)
+        for entry_id, kind, user_id, target_id, value, timestamp in records:
+            pl.execute_command('XADD', InteractionStorageBase.dead_letter_key,
+                               'MAXLEN', '~', constants.INTERACTION_DEAD_LETTER_MAX_LENGTH, '*',
+                               'id', entry_id, 'k', kind, 'u', user_id, 't', target_id, 'v', value,
+                               'ts', timestamp, 'reason', reason)
+        pl.execute()
+        self.ack([record[0] for record in records])
+
+    def ack(self, entry_ids):
+        """
+        确认已写入数据库，并从流中删除
+        :param entry_ids: list
+        """
+        pl = self.r.pipeline(transaction=False)
+        pl.execute_command('XACK', InteractionStorageBase.stream_key, InteractionStorageBase.group, *entry_ids)
+        pl.execute_command('XDEL', InteractionStorageBase.stream_key, *entry_ids)
+        pl.execute()
+
+    def _create_group(self):
+        if self._group_created:
+            return
+        try:
+            self.r.execute_command('XGROUP', 'CREATE', InteractionStorageBase.stream_key,
+                                   InteractionStorageBase.group, '0', 'MKSTREAM')
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise e
+        self._group_created = True
+
+    def _claim_pending(self, count):
+        """
+        重新读取超时未确认的操作
+        :param count: 数量
+        :return: (entries, dead_ids) dead_ids为投递次数超过上限的操作id
+        """
+        pending = self.r.execute_command('XPENDING', InteractionStorageBase.stream_key,
+                                         InteractionStorageBase.group, '-', '+', count)
+        entry_ids = []
+        dead_ids = set()
+        for entry_id, _, idle, deliveries in pending:
+            if idle < constants.INTERACTION_PENDING_CLAIM_IDLE:
+                continue
+            entry_ids.append(entry_id)
+            if deliveries >= constants.INTERACTION_MAX_DELIVERIES:
+                dead_ids.add(entry_id.decode())
+        if not entry_ids:
+            return [], dead_ids
+        ret = self.r.execute_command('XCLAIM', InteractionStorageBase.stream_key, InteractionStorageBase.group,
+                                     self.consumer, constants.INTERACTION_PENDING_CLAIM_IDLE, *entry_ids)
+        entries = [entry for entry in ret if entry]
+        # 已被MAXLEN裁剪的操作不再返回，仍需确认
+        claimed = {entry_id for entry_id, _ in entries}
+        entries.extend((entry_id, None) for entry_id in entry_ids if entry_id not in claimed)
+        return entries, dead_ids
+
+
+def merge_interactions(records):
+    """
+    合并同一用户对同一目标的多次操作，只保留最后的状态
+    :param records: list [(entry_id, kind, user_id, target_id, value, timestamp)] 按写入顺序排列
+    :return: dict {kind: [row, ..]}
+    """
+    latest = {}
+    for _, kind, user_id, target_id, value, timestamp in records:
+        latest[(kind, user_id, target_id)] = (value, timestamp)
+
+    rows = {}
+    for (kind, user_id, target_id), (value, timestamp) in latest.items():
+        storage = STORAGES.get(kind)
+        if storage is None:
+            continue
+        rows.setdefault(kind, []).append(storage.row(user_id, target_id, value, timestamp))
+    return rows
@@ -0,0 +1,145 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from flask import current_app
+from redis.exceptions import RedisError
+
+from . import constants
+
+
+class InvalidationBus(object):
+    """
+    进程内缓存的跨进程失效通知
+    数据修改时通过redis发布订阅广播失效的键，每个进程的后台线程订阅并删除本地缓存条目，
+    也可通过add_handler注册其他需要跨进程同步的进程内数据（如布隆过滤器镜像）
+    """
+    def __init__(self):
+        self._handlers = {}
+        self._local = threading.local()
+        self._redis = None
+        self._logger = None
+        self._thread = None
+
+    def register(self, cache):
+        """
+        注册进程内缓存
+        :param cache: LocalLRUCache对象，需设置name
+        :return: cache
+        """
+        if not cache.name:
+            raise ValueError('cache name is required.')
+        self.add_handler(cache.name, lambda keys: cache.delete(*keys), cache.clear)
+        return cache
+
+    def add_handler(self, name, on_message, on_reset):
+        """
+        注册通知处理函数
+        :param name: 通知名称
+        :param on_message: 收到通知时调用，参数为键列表
+        :param on_reset: 订阅断开可能错过通知时调用，无参数
+        """
+        self._handlers[name] = (on_message, on_reset)
+
+    def init_app(self, app):
+        """
+        启动订阅线程
+        :param app: Flask app对象
+        """
+        self._redis = app.redis_master
+        self._logger = app.logger
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._listen, name='cache-invalidation', daemon=True)
+            self._thread.start()
+
+    def invalidate(self, name, keys):
+        """
+        失效进程内缓存条目，在batch上下文中时合并到退出上下文时一次发布
+        :param name: 缓存名称
+        :param keys: 缓存键列表
+        """
+        handler = self._handlers.get(name)
+        if handler is not None:
+            handler[0](keys)
+
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            pending.setdefault(name, set()).update(keys)
+        else:
+            self._publish({name: keys})
+
+    @contextmanager
+    def batch(self):
+        """
+        合并上下文中的失效通知
+        """
+        if getattr(self._local, 'pending', None) is not None:
+            # 嵌套时由最外层发布
+            yield
+            return
+
+        self._local.pending = {}
+        try:
+            yield
+        finally:
+            pending, self._local.pending = self._local.pending, None
+            if pending:
+                self._publish(pending)
+
+    def _publish(self, invalidations):
+        """
+        发布失效通知
+        :param invalidations: dict {name: keys}
+        """
+        message = json.dumps({name: list(keys) for name, keys in invalidations.items()}, separators=(',', ':'))
+        try:
+            current_app.redis_master.publish(constants.INVALIDATION_CHANNEL, message)
+        except RedisError as e:
+            current_app.logger.error(e)
+
+    def _listen(self):
+        """
+        订阅失效通知，断线后重连
+        重连前重置所有进程内数据，避免断线期间错过的通知导致数据长期不一致
+        """
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(constants.INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    try:
+                        self._handle(message['data'])
+                    except Exception as e:
+                        # 单条通知处理失败不能终止订阅线程
+                        self._logger.exception('[InvalidationBus] {}'.format(e))
+            except Exception as e:
+                self._logger.error('[InvalidationBus] {}'.format(e))
+
+            for _, on_reset in self._handlers.values():
+                try:
+                    on_reset()
+                except Exception as e:
+                    self._logger.exception('[InvalidationBus] {}'.format(e))
+            time.sleep(constants.INVALIDATION_RECONNECT_INTERVAL)
+
+    def _handle(self, data):
+        """
+        处理失效通知
+        :param data: bytes 通知内容
+        """
+        try:
+            invalidations = json.loads(data.decode())
+        except ValueError as e:
+            self._logger.error('[InvalidationBus] {}'.format(e))
+            return
+        if not isinstance(invalidations, dict):
+            self._logger.error('[InvalidationBus] invalid message {}'.format(data))
+            return
+
+        for name, keys in invalidations.items():
+            handler = self._handlers.get(name)
+            if handler is not None:
+                handler[0](keys)
+
+
+invalidation_bus = InvalidationBus()
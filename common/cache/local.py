@@ -0,0 +1,79 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+# 进程内缓存未命中的标记，用于区分缓存的None值（记录不存在）
+MISSING = object()
+
+
+class LocalLRUCache(object):
+    """
+    进程内有界LRU缓存，线程安全
+    """
+    def __init__(self, max_size, ttl, name=''):
+        """
+        初始化
+        :param max_size: 最大条目数，超出时淘汰最久未使用的条目
+        :param ttl: 条目有效期，秒
+        :param name: 缓存名称，用于跨进程失效通知
+        """
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        """
+        获取
+        :param key: 键
+        :param default: 未命中或已过期时的返回值
+        :return:
+        """
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+
+            expire_at, value = item
+            if expire_at <= now:
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        设置
+        :param key: 键
+        :param value: 值，可为None
+        :param ttl: 有效期，秒，默认使用初始化时的有效期
+        """
+        expire_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expire_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        """
+        删除
+        :param keys: 键
+        """
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        """
+        清空
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
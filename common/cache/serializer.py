@@ -0,0 +1,101 @@
+import json
+import zlib
+import pickle
+
+
+class Serializer(object):
+    """
+    缓存数据序列化基类
+    """
+    def dumps(self, record):
+        """
+        序列化
+        :param record: dict
+        :return: bytes
+        """
+        raise NotImplementedError
+
+    def loads(self, data):
+        """
+        反序列化
+        :param data: bytes
+        :return: dict or None 数据格式或版本无法识别时返回None，调用方按缓存未命中处理
+        """
+        raise NotImplementedError
+
+
+class PickleSerializer(Serializer):
+    """
+    pickle序列化，仅用于性能对比，见 scripts/bench_cache_serializer.py
+    """
+    def dumps(self, record):
+        return pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class JSONSerializer(Serializer):
+    """
+    json序列化
+    """
+    def dumps(self, record):
+        return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode()
+
+    def loads(self, data):
+        try:
+            return json.loads(data.decode())
+        except ValueError:
+            return None
+
+
+class CompactSerializer(Serializer):
+    """
+    带版本号的紧凑序列化
+    格式：1字节标志位 + 1字节版本号 + 数据
+    数据为按字段顺序排列的json数组，不重复保存字段名，超过压缩阈值时使用zlib压缩。
+    字段变化时增加版本号，旧版本的字段列表保留用于读取部署前写入的缓存，
+    无法识别的版本（包括旧的pickle数据）按缓存未命中处理
+    """
+    FLAG_COMPRESSED = 0x01
+
+    def __init__(self, versions, compress_threshold=1024, compress_level=6):
+        """
+        初始化
+        :param versions: dict {version: (field, ..)}，最大的版本号用于写入
+        :param compress_threshold: 压缩阈值，字节
+        :param compress_level: zlib压缩级别
+        """
+        self.versions = versions
+        self.version = max(versions)
+        self.fields = versions[self.version]
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def dumps(self, record):
+        payload = json.dumps([record.get(field) for field in self.fields],
+                             ensure_ascii=False, separators=(',', ':')).encode()
+        flags = 0
+        if len(payload) > self.compress_threshold:
+            payload = zlib.compress(payload, self.compress_level)
+            flags |= self.FLAG_COMPRESSED
+        return bytes((flags, self.version)) + payload
+
+    def loads(self, data):
+        if len(data) < 2:
+            return None
+
+        flags, version = data[0], data[1]
+        fields = self.versions.get(version)
+        if flags & ~self.FLAG_COMPRESSED or fields is None:
+            return None
+
+        payload = data[2:]
+        try:
+            if flags & self.FLAG_COMPRESSED:
+                payload = zlib.decompress(payload)
+            values = json.loads(payload.decode())
+        except (zlib.error, ValueError):
+            return None
+
+        return dict(zip(fields, values))
@@ -0,0 +1,151 @@
+import math
+import time
+import uuid
+import random
+import threading
+from flask import current_app
+from redis.exceptions import RedisError
+
+from . import constants
+
+
+class _Call(object):
+    """
+    一次进行中的加载
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    进程内合并并发的缓存未命中加载
+    同一个键同时只有一个线程执行加载，其他线程等待并共享加载结果
+    """
+    def __init__(self, wait_timeout=constants.SINGLE_FLIGHT_WAIT_TIMEOUT):
+        """
+        初始化
+        :param wait_timeout: 等待其他线程加载的超时时间，秒，超时后自行加载
+        """
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do_many(self, keys, loader):
+        """
+        批量加载
+        :param keys: 键列表
+        :param loader: 加载函数，参数为由当前线程负责加载的键列表，返回dict {key: value}
+        :return: dict {key: value}
+        """
+        own = {}
+        waiting = {}
+        with self._lock:
+            for key in keys:
+                call = self._calls.get(key)
+                if call is None:
+                    call = _Call()
+                    self._calls[key] = call
+                    own[key] = call
+                else:
+                    waiting[key] = call
+
+        results = {}
+        if own:
+            results.update(self._run(own, loader))
+
+        timeout_keys = []
+        for key, call in waiting.items():
+            if not call.event.wait(self.wait_timeout):
+                timeout_keys.append(key)
+            elif call.error is not None:
+                raise call.error
+            else:
+                results[key] = call.value
+
+        if timeout_keys:
+            results.update(loader(timeout_keys))
+
+        return results
+
+    def _run(self, calls, loader):
+        """
+        执行加载并唤醒等待的线程
+        :param calls: dict {key: _Call}
+        :param loader: 加载函数
+        :return: dict {key: value}
+        """
+        try:
+            loaded = loader(list(calls))
+        except Exception as e:
+            for call in calls.values():
+                call.error = e
+            raise
+        else:
+            for key, call in calls.items():
+                call.value = loaded.get(key)
+            return loaded
+        finally:
+            with self._lock:
+                for key in calls:
+                    self._calls.pop(key, None)
+            for call in calls.values():
+                call.event.set()
+
+
+class RedisLease(object):
+    """
+    跨进程的缓存重建租约
+    获得租约的进程负责查询数据库重建缓存，其他进程返回旧数据或短暂等待
+    租约有效期很短，重建后不释放，由redis过期删除：逐个键校验并删除需要与键数量相同的往返，
+    重建后缓存已写入，其他进程不再申请租约；清除缓存时一并删除租约，见 RecordHashCache.clear_many
+    """
+    def __init__(self, ttl=constants.CACHE_LEASE_TTL):
+        """
+        初始化
+        :param ttl: 租约有效期，毫秒
+        """
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+
+    @staticmethod
+    def lease_key(key):
+        return '{}:lease'.format(key)
+
+    def acquire_many(self, keys):
+        """
+        批量申请租约
+        :param keys: 缓存键列表
+        :return: list 成功获得租约的缓存键，redis不可用时视为全部获得
+        """
+        if not keys:
+            return []
+
+        r = current_app.redis_cluster
+        try:
+            pl = r.pipeline()
+            for key in keys:
+                pl.set(self.lease_key(key), self.token, px=self.ttl, nx=True)
+            rets = pl.execute()
+        except RedisError as e:
+            current_app.logger.error(e)
+            return list(keys)
+
+        return [key for key, ret in zip(keys, rets) if ret]
+
+
+def should_refresh_early(expire_at, delta, beta=constants.CACHE_EARLY_REFRESH_BETA, now=None):
+    """
+    概率提前刷新判断（XFetch）
+    越接近过期、重建耗时越长，提前刷新的概率越大，热点键会在过期前被某个请求重建
+    :param expire_at: 逻辑过期时间戳，秒
+    :param delta: 上次重建耗时，秒
+    :param beta: 提前程度系数，越大越早刷新
+    :param now: 当前时间戳，秒
+    :return: bool
+    """
+    if now is None:
+        now = time.time()
+    return now - delta * beta * math.log(1.0 - random.random()) >= expire_at
@@ -0,0 +1,72 @@
+from flask import current_app
+from redis.exceptions import RedisError
+
+from . import constants
+
+
+class SMSVerificationCodeStorage(object):
+    """
+    短信验证码
+    校验与使用在一个lua脚本中完成，一次网络往返，验证码只能使用一次；
+    校验失败时累计错误次数，达到上限后删除验证码并锁定手机号，锁定期间不再比对验证码
+    """
+    # 校验结果
+    VERIFIED = 1
+    INVALID = 0
+    LOCKED = -1
+
+    # KEYS: 验证码, 错误次数  ARGV: 验证码, 最大错误次数, 锁定时长
+    VERIFY_SCRIPT = """
+    local max_attempts = tonumber(ARGV[2])
+    if tonumber(redis.call('get', KEYS[2]) or '0') >= max_attempts then
+        return -1
+    end
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        redis.call('del', KEYS[1], KEYS[2])
+        return 1
+    end
+    local attempts = redis.call('incr', KEYS[2])
+    if attempts == 1 then
+        redis.call('expire', KEYS[2], ARGV[3])
+    end
+    if attempts >= max_attempts then
+        redis.call('expire', KEYS[2], ARGV[3])
+        redis.call('del', KEYS[1])
+        return -1
+    end
+    return 0
+    """
+
+    _verify_script = None
+
+    def __init__(self, mobile):
+        self.key = 'app:code:{}'.format(mobile)
+        self.attempts_key = 'app:code:{}:attempts'.format(mobile)
+
+    def save(self, code, expires):
+        """
+        保存验证码
+        :param code: 验证码
+        :param expires: 有效期, 秒
+        """
+        current_app.redis_master.setex(self.key, expires, code)
+
+    def verify(self, code):
+        """
+        校验并使用验证码
+        :param code: 用户提交的验证码
+        :return: VERIFIED 通过 / INVALID 错误或已过期 / LOCKED 错误次数过多
+        """
+        r = current_app.redis_master
+        cls = type(self)
+        if cls._verify_script is None:
+            cls._verify_script = r.register_script(self.VERIFY_SCRIPT)
+
+        try:
+            return cls._verify_script(keys=[self.key, self.attempts_key],
+                                      args=[code, constants.SMS_VERIFICATION_MAX_ATTEMPTS,
+                                            constants.SMS_VERIFICATION_LOCK_EXPIRES],
+                                      client=r)
+        except RedisError as e:
+            current_app.logger.error(e)
+            raise e
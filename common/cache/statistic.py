@@ -0,0 +1,362 @@
+from flask import current_app
+from redis.exceptions import ConnectionError, RedisError
+from sqlalchemy import func
+from sqlalchemy.exc import DatabaseError
+
+from models import db
+from models.db_routing.sharding import ShardMap
+from models.news import Article, Attitude, Collection, Comment, CommentLiking
+from models.user import Relation
+from . import constants
+from .base import chunks
+from .interaction import InteractionStorageBase
+
+
+class CountStorageBase(object):
+    """
+    统计数据存储基类
+    每个统计指标使用一个zset，成员为数据id，分数为统计值
+    """
+    # redis键，由子类设置
+    key = ''
+
+    # 可修正的子类设置：按此字段分组统计真实值，及统计条件
+    count_column = None
+    count_criterion = ()
+
+    @classmethod
+    def get(cls, target_id):
+        """
+        获取统计值
+        :param target_id: 数据id
+        :return: int
+        """
+        return cls.get_counts([target_id])[target_id]
+
+    @classmethod
+    def get_counts(cls, target_ids):
+        """
+        批量获取统计值，一次网络往返
+        :param target_ids: 数据id列表
+        :return: dict {target_id: count}
+        """
+        if not target_ids:
+            return {}
+
+        try:
+            rets = cls._zscore_many(current_app.redis_master, target_ids)
+        except ConnectionError as e:
+            current_app.logger.error(e)
+            rets = cls._zscore_many(current_app.redis_slave, target_ids)
+
+        return {target_id: int(ret) if ret else 0 for target_id, ret in zip(target_ids, rets)}
+
+    @classmethod
+    def _zscore_many(cls, r, target_ids):
+        pl = r.pipeline(transaction=False)
+        for target_id in target_ids:
+            pl.zscore(cls.key, target_id)
+        return pl.execute()
+
+    @classmethod
+    def incr(cls, target_id, increment=1):
+        """
+        增加统计值
+        :param target_id: 数据id
+        :param increment: 增量，可为负数
+        """
+        incr_many([(cls, target_id, increment)])
+
+    @classmethod
+    def db_query(cls, after_id, limit):
+        """
+        从数据库统计真实值，按数据id分页，使用主库
+        :param after_id: 上一页最后的数据id
+        :param limit: 每页数量
+        :return: list [(target_id, count)] 按target_id升序
+        """
+        return cls._grouped_count(cls.count_column > after_id, limit=limit)
+
+    @classmethod
+    def db_count(cls, target_ids):
+        """
+        从数据库统计指定数据的真实值，使用主库
+        :param target_ids: 数据id列表
+        :return: dict {target_id: count}，数据库中无记录的数据不在结果中
+        """
+        return dict(cls._grouped_count(cls.count_column.in_(target_ids)))
+
+    @classmethod
+    def _grouped_count(cls, *criterion, limit=None):
+        """
+        按count_column分组统计的通用查询
+        分片模型在每个分片上统计后合并
+        :param criterion: 附加的查询条件
+        :param limit: 按数据id升序分页的每页数量，为None时不分页
+        """
+        column = cls.count_column
+
+        def query(session, shard_id=None):
+            q = session.query(column, func.count()).filter(*(cls.count_criterion + criterion)).group_by(column)
+            if limit is not None:
+                q = q.order_by(column).limit(limit)
+            return q.all()
+
+        if not ShardMap.shard_key(column.class_):
+            return query(db.session)
+        return merge_grouped_counts(db.scatter_gather(query, read=False), limit)
+
+    @classmethod
+    def reconcile(cls):
+        """
+        修正统计数据
+        需在主库上执行，分批处理，不一次读取整个zset：
+        redis中已有的数据分批ZSCAN，按这批数据id统计数据库，与统计后立即读取的redis值比较；
+        redis中没有的数据按数据id分页统计数据库补上。
+        最后以增量（ZINCRBY）修正有偏差的数据，不覆盖修正期间的并发修改；数据库中已无记录的数据id修正为0后删除。
+        以下数据不修正，由下次修正处理：
+        统计前后统计值发生变化的数据（并发操作可能尚未写入数据库）；
+        用户操作流中尚未写入数据库的操作涉及的数据
+        :return: int 修正的数据数量
+        """
+        r = current_app.redis_master
+        batch_size = constants.STATISTIC_RECONCILE_BATCH_SIZE
+        # 先读取流再统计，统计前已从流中删除的操作一定已写入数据库
+        pending = InteractionStorageBase.pending_count_targets(r).get(cls.key, set())
+
+        deltas = {}
+        cursor = 0
+        while True:
+            cursor, items = r.zscan(cls.key, cursor, count=batch_size)
+            if items:
+                before = {int(member): int(score) for member, score in items}
+                target_ids = list(before)
+                counts = cls._db_call(cls.db_count, target_ids)
+                current = cls._zscore_many(r, target_ids)
+
+                for target_id, ret in zip(target_ids, current):
+                    score = int(ret) if ret else 0
+                    count = counts.get(target_id, 0)
+                    if score != count and before[target_id] == score:
+                        deltas[target_id] = count - score
+            if cursor == 0:
+                break
+
+        after_id = 0
+        while True:
+            rows = cls._db_call(cls.db_query, after_id, batch_size)
+            if not rows:
+                break
+
+            target_ids = [target_id for target_id, _ in rows]
+            current = cls._zscore_many(r, target_ids)
+            for (target_id, count), ret in zip(rows, current):
+                # 统计后仍不在redis中，统计前也没有对应的操作
+                if ret is None and count != 0:
+                    deltas[target_id] = count
+
+            after_id = target_ids[-1]
+
+        pending |= InteractionStorageBase.pending_count_targets(r).get(cls.key, set())
+        deltas = [(target_id, delta) for target_id, delta in deltas.items() if target_id not in pending]
+        for batch in chunks(deltas, constants.REDIS_PIPELINE_BATCH_SIZE):
+            pl = r.pipeline(transaction=False)
+            for target_id, delta in batch:
+                pl.zincrby(cls.key, target_id, delta)
+            pl.execute()
+        r.zremrangebyscore(cls.key, 0, 0)
+
+        return len(deltas)
+
+    @staticmethod
+    def _db_call(query_func, *args):
+        try:
+            return query_func(*args)
+        except DatabaseError as e:
+            current_app.logger.error(e)
+            raise e
+
+
+def merge_grouped_counts(results, limit):
+    """
+    合并各分片按数据id分组统计的结果
+    每个分片最多返回limit条，只保留不超过满页分片最后数据id的部分，其后的数据id由下一页统计，避免遗漏
+    :param results: list 每个分片的 [(target_id, count)]，按target_id升序
+    :param limit: 每页数量，为None时未分页
+    :return: list [(target_id, count)] 按target_id升序
+    """
+    full_pages = [rows[-1][0] for rows in results if limit is not None and len(rows) >= limit]
+    bound = min(full_pages) if full_pages else None
+
+    counts = {}
+    for rows in results:
+        for target_id, count in rows:
+            if bound is None or target_id <= bound:
+                counts[target_id] = counts.get(target_id, 0) + count
+    return sorted(counts.items())
+
+
+def incr_many(increments):
+    """
+    批量增加多个指标的统计值，一次网络往返
+    :param increments: list [(CountStorage子类, target_id, increment)]
+    """
+    pl = current_app.redis_master.pipeline(transaction=False)
+    for storage, target_id, increment in increments:
+        pl.zincrby(storage.key, target_id, increment)
+    try:
+        pl.execute()
+    except RedisError as e:
+        current_app.logger.error(e)
+
+
+class UserArticlesCountStorage(CountStorageBase):
+    """
+    用户文章数量
+    """
+    key = 'count:user:arts'
+    count_column = Article.user_id
+    count_criterion = (Article.status == Article.STATUS.APPROVED,)
+
+
+class UserFollowingsCountStorage(CountStorageBase):
+    """
+    用户关注数量
+    """
+    key = 'count:user:followings'
+    count_column = Relation.user_id
+    count_criterion = (Relation.relation == Relation.RELATION.FOLLOW,)
+
+
+class UserFansCountStorage(CountStorageBase):
+    """
+    用户粉丝数量
+    """
+    key = 'count:user:fans'
+    count_column = Relation.target_user_id
+    count_criterion = (Relation.relation == Relation.RELATION.FOLLOW,)
+
+
+class UserLikedCountStorage(CountStorageBase):
+    """
+    用户文章被点赞数量
+    """
+    key = 'count:user:liked'
+
+    @classmethod
+    def db_query(cls, after_id, limit):
+        while True:
+            author_ids = [row[0] for row in db.session.query(Article.user_id)
+                          .filter(Article.user_id > after_id)
+                          .group_by(Article.user_id).order_by(Article.user_id).limit(limit).all()]
+            if not author_ids:
+                return []
+
+            counts = cls.db_count(author_ids)
+            if counts:
+                return sorted(counts.items())
+            after_id = author_ids[-1]
+
+    @classmethod
+    def db_count(cls, target_ids):
+        # 点赞记录按点赞用户分片，无法与文章表关联查询，
+        # 先查询这些作者的文章，再在每个分片上统计这些文章的点赞数量
+        authors = dict(db.session.query(Article.id, Article.user_id)
+                       .filter(Article.user_id.in_(target_ids)).all())
+        counts = {}
+        for article_ids in chunks(list(authors), constants.STATISTIC_RECONCILE_BATCH_SIZE):
+            def query(session, shard_id=None):
+                return session.query(Attitude.article_id, func.count()) \
+                    .filter(Attitude.article_id.in_(article_ids), Attitude.attitude == Attitude.ATTITUDE.LIKING) \
+                    .group_by(Attitude.article_id).all()
+
+            for rows in db.scatter_gather(query, read=False):
+                for article_id, count in rows:
+                    author_id = authors[article_id]
+                    counts[author_id] = counts.get(author_id, 0) + count
+        return counts
+
+
+class UserReadingCountStorage(CountStorageBase):
+    """
+    用户文章累计被阅读数量
+    阅读记录不落库，无法从数据库修正
+    """
+    key = 'count:user:reading'
+
+
+class ArticleReadingCountStorage(CountStorageBase):
+    """
+    文章阅读数量
+    阅读记录不落库，无法从数据库修正
+    """
+    key = 'count:art:reading'
+
+
+class ArticleLikingCountStorage(CountStorageBase):
+    """
+    文章点赞数量
+    """
+    key = 'count:art:liking'
+    count_column = Attitude.article_id
+    count_criterion = (Attitude.attitude == Attitude.ATTITUDE.LIKING,)
+
+
+class ArticleDislikeCountStorage(CountStorageBase):
+    """
+    文章不喜欢数量
+    """
+    key = 'count:art:dislike'
+    count_column = Attitude.article_id
+    count_criterion = (Attitude.attitude == Attitude.ATTITUDE.DISLIKE,)
+
+
+class ArticleCollectingCountStorage(CountStorageBase):
+    """
+    文章收藏数量
+    """
+    key = 'count:art:collecting'
+    count_column = Collection.article_id
+    count_criterion = (Collection.is_deleted == False,)
+
+
+class ArticleCommentCountStorage(CountStorageBase):
+    """
+    文章评论数量
+    """
+    key = 'count:art:comm'
+    count_column = Comment.article_id
+    count_criterion = (Comment.parent_id.is_(None), Comment.status == Comment.STATUS.APPROVED)
+
+
+class CommentLikingCountStorage(CountStorageBase):
+    """
+    评论点赞数量
+    """
+    key = 'count:comm:liking'
+    count_column = CommentLiking.comment_id
+    count_criterion = (CommentLiking.is_deleted == False,)
+
+
+class CommentReplyCountStorage(CountStorageBase):
+    """
+    评论回复数量
+    """
+    key = 'count:comm:reply'
+    count_column = Comment.parent_id
+    count_criterion = (Comment.status == Comment.STATUS.APPROVED,)
+
+
+# 可从数据库修正的统计指标
+RECONCILABLE_STORAGES = (
+    UserArticlesCountStorage,
+    UserFollowingsCountStorage,
+    UserFansCountStorage,
+    UserLikedCountStorage,
+    ArticleLikingCountStorage,
+    ArticleDislikeCountStorage,
+    ArticleCollectingCountStorage,
+    ArticleCommentCountStorage,
+    CommentLikingCountStorage,
+    CommentReplyCountStorage,
+)
@@ -0,0 +1,149 @@
+import time
+import threading
+from flask import current_app
+from redis.exceptions import RedisError
+
+from . import constants
+from .bloom import BloomFilter
+from .invalidation import invalidation_bus
+
+
+class TokenRevocationList(object):
+    """
+    已撤销的token
+    按token id（一次登录颁发的token与refresh_token共用）撤销单次登录，按用户id撤销用户此前颁发的所有token。
+    撤销记录保存在redis中，每个进程保存一份布隆过滤器镜像，撤销时通过invalidation_bus通知所有进程更新镜像，
+    镜像由定时任务定期从redis全量同步并去掉过期的记录。
+    未撤销的token只检查本地镜像，不访问网络；镜像命中（已撤销或误判）时才查询redis
+    """
+    # 所有撤销记录，member为 t:{token_id} / u:{user_id}，score为记录的过期时间戳
+    key = 'token:revoked'
+
+    def __init__(self, capacity, error_rate):
+        """
+        初始化
+        :param capacity: 布隆过滤器镜像容量
+        :param error_rate: 布隆过滤器镜像误判率
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+        self._local = None
+        self._lock = threading.Lock()
+        self._syncing_items = None
+
+        invalidation_bus.add_handler(self.key, self._add_local, self._reset_local)
+
+    @staticmethod
+    def _token_member(token_id):
+        return 't:{}'.format(token_id)
+
+    @staticmethod
+    def _user_member(user_id):
+        return 'u:{}'.format(user_id)
+
+    def _revoke(self, member, value):
+        """
+        保存撤销记录，保留到此前颁发的refresh_token全部过期为止
+        :param member: 记录名称
+        :param value: 记录的值
+        """
+        ttl = current_app.config['JWT_REFRESH_DAYS'] * 24 * 60 * 60
+        pl = current_app.redis_master.pipeline()
+        pl.zadd(self.key, int(time.time()) + ttl, member)
+        pl.setex('{}:{}'.format(self.key, member), ttl, value)
+        try:
+            pl.execute()
+        except RedisError as e:
+            current_app.logger.error(e)
+            raise e
+
+        invalidation_bus.invalidate(self.key, [member])
+
+    def revoke_token(self, token_id):
+        """
+        撤销一次登录颁发的token，用于退出登录
+        :param token_id: token id
+        """
+        self._revoke(self._token_member(token_id), 1)
+
+    def revoke_user(self, user_id):
+        """
+        撤销用户此前颁发的所有token，用于禁用用户等
+        token的iat精确到秒，记录撤销时间的下一秒，撤销的同一秒内颁发的token也一并撤销
+        :param user_id: 用户id
+        """
+        self._revoke(self._user_member(user_id), int(time.time()) + 1)
+
+    def is_revoked(self, payload):
+        """
+        判断token是否已撤销
+        :param payload: dict token载荷
+        :return: bool
+        """
+        members = [self._token_member(payload.get('tid')), self._user_member(payload.get('user_id'))]
+        if not any(self._might_contain(member) for member in members):
+            return False
+
+        try:
+            token_revoked, user_revoked_at = current_app.redis_master.mget(
+                ['{}:{}'.format(self.key, member) for member in members])
+        except RedisError as e:
+            # 本地镜像命中时大多确实已撤销，无法确认时按已撤销处理
+            current_app.logger.error(e)
+            return True
+
+        if token_revoked is not None:
+            return True
+        return user_revoked_at is not None and payload.get('iat', 0) < int(user_revoked_at)
+
+    def _might_contain(self, member):
+        """
+        本地镜像未同步时返回True，由调用方查询redis
+        """
+        local = self._local
+        if local is None:
+            return True
+        return member in local
+
+    def _add_local(self, members):
+        with self._lock:
+            if self._syncing_items is not None:
+                self._syncing_items.extend(members)
+            if self._local is not None:
+                for member in members:
+                    self._local.add(member)
+
+    def _reset_local(self):
+        self._local = None
+
+    def sync(self):
+        """
+        从redis全量同步本地镜像，并删除过期的撤销记录
+        """
+        with self._lock:
+            self._syncing_items = []
+
+        r = current_app.redis_master
+        now = int(time.time())
+        try:
+            r.zremrangebyscore(self.key, '-inf', now)
+            members = r.zrangebyscore(self.key, now, '+inf')
+        except RedisError as e:
+            current_app.logger.error(e)
+            members = None
+
+        with self._lock:
+            items, self._syncing_items = self._syncing_items, None
+            if members is None:
+                return
+            local = BloomFilter(self.capacity, self.error_rate)
+            for member in members:
+                local.add(member.decode())
+            for item in items:
+                local.add(item)
+            self._local = local
+
+
+token_revocation_list = TokenRevocationList(constants.TOKEN_REVOCATION_BLOOM_CAPACITY,
+                                            constants.BLOOM_FILTER_ERROR_RATE)
@@ -0,0 +1,229 @@
+import time
+from flask import current_app
+from redis.exceptions import ConnectionError, RedisError
+from sqlalchemy.orm import load_only
+from sqlalchemy.exc import DatabaseError
+
+from models.user import User
+from . import constants
+from .base import RecordHashCache
+from .local import LocalLRUCache
+from .invalidation import invalidation_bus
+
+
+class UserProfileCache(RecordHashCache):
+    """
+    用户资料缓存
+    """
+    key_format = 'user:{}:profile'
+    ttl = constants.UserProfileCacheTTL
+    not_exists_ttl = constants.UserNotExistsCacheTTL
+    local_cache = invalidation_bus.register(LocalLRUCache(constants.USER_PROFILE_LOCAL_CACHE_MAX_SIZE,
+                                                          constants.USER_PROFILE_LOCAL_CACHE_TTL,
+                                                          name='user:profile'))
+
+    @classmethod
+    def _load_many(cls, user_ids):
+        """
+        从数据库批量查询用户资料
+        :param user_ids: 用户id列表
+        :return: dict {user_id: profile}
+        """
+        try:
+            users = User.query.options(load_only(
+                User.id,
+                User.mobile,
+                User.name,
+                User.profile_photo,
+                User.is_media,
+                User.introduction,
+                User.certificate
+            )).filter(User.id.in_(user_ids)).all()
+        except DatabaseError as e:
+            current_app.logger.error(e)
+            raise e
+
+        return {
+            user.id: {
+                'mobile': user.mobile,
+                'name': user.name,
+                'photo': user.profile_photo or '',
+                'is_media': bool(user.is_media),
+                'intro': user.introduction or '',
+                'certi': user.certificate or '',
+            } for user in users
+        }
+
+    @classmethod
+    def _to_hash(cls, record):
+        data = dict(record)
+        data['is_media'] = 1 if record['is_media'] else 0
+        return data
+
+    @classmethod
+    def _from_hash(cls, data):
+        data['is_media'] = data.get('is_media') == '1'
+        return data
+
+
+class UserMobileCache(object):
+    """
+    手机号对应的用户id与状态缓存，用于登录
+    注册与修改用户状态后需更新或清除缓存
+    """
+    # 用户不存在时缓存的值
+    NOT_EXISTS = b'-1'
+
+    def __init__(self, mobile):
+        self.key = 'user:mob:{}'.format(mobile)
+        self.mobile = mobile
+
+    def get(self):
+        """
+        获取手机号对应的用户，缓存未命中时使用当前session查询数据库
+        :return: dict {'user_id', 'status'} or None
+        """
+        r = current_app.redis_cluster
+        try:
+            ret = r.get(self.key)
+        except RedisError as e:
+            current_app.logger.error(e)
+            ret = None
+
+        if ret == self.NOT_EXISTS:
+            return None
+        if ret:
+            user_id, status = ret.decode().split(':')
+            return {'user_id': int(user_id), 'status': int(status)}
+
+        try:
+            user = User.query.options(load_only(User.id, User.status)).filter_by(mobile=self.mobile).first()
+        except DatabaseError as e:
+            current_app.logger.error(e)
+            raise e
+
+        if user is None:
+            try:
+                r.setex(self.key, constants.UserNotExistsCacheTTL.get_val(), self.NOT_EXISTS)
+            except RedisError as e:
+                current_app.logger.error(e)
+            return None
+
+        self.save(user.id, user.status)
+        return {'user_id': user.id, 'status': user.status}
+
+    def save(self, user_id, status):
+        """
+        设置缓存
+        :param user_id: 用户id
+        :param status: 用户状态
+        """
+        try:
+            current_app.redis_cluster.setex(self.key, constants.UserMobileCacheTTL.get_val(),
+                                            '{}:{}'.format(user_id, status))
+        except RedisError as e:
+            current_app.logger.error(e)
+
+    def clear(self):
+        """
+        清除缓存
+        """
+        try:
+            current_app.redis_cluster.delete(self.key)
+        except RedisError as e:
+            current_app.logger.error(e)
+
+
+class UserReadingHistoryStorage(object):
+    """
+    用户阅读历史
+    每个用户一个zset，成员为文章id，分数为阅读时间戳，只保留最近的READING_HISTORY_MAX_COUNT条，
+    阅读记录同时追加到队列中，由定时任务批量持久化到数据库
+    """
+    # 待持久化的阅读记录队列，元素为 '{user_id}:{article_id}:{timestamp}'
+    queue_key = 'his:queue'
+    # 数据错误无法写入的阅读记录，元素为 '{user_id}:{article_id}:{timestamp}:{reason}'
+    dead_letter_key = 'his:dead'
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.key = 'user:{}:his'.format(user_id)
+
+    def save(self, article_id):
+        """
+        保存阅读记录，一次网络往返，不访问数据库
+        :param article_id: 文章id
+        """
+        timestamp = time.time()
+        pl = current_app.redis_master.pipeline(transaction=False)
+        pl.zadd(self.key, timestamp, article_id)
+        pl.zremrangebyrank(self.key, 0, -constants.READING_HISTORY_MAX_COUNT - 1)
+        pl.rpush(self.queue_key, '{}:{}:{}'.format(self.user_id, article_id, timestamp))
+        pl.ltrim(self.queue_key, -constants.READING_HISTORY_QUEUE_MAX_LENGTH, -1)
+        try:
+            pl.execute()
+        except RedisError as e:
+            current_app.logger.error(e)
+
+    def get(self, page, per_page):
+        """
+        获取阅读历史，只读redis
+        :param page: 页数
+        :param per_page: 每页数量
+        :return: total_count, [article_id, ..]
+        """
+        start = (page - 1) * per_page
+        end = start + per_page - 1
+        try:
+            pl = current_app.redis_master.pipeline(transaction=False)
+            pl.zcard(self.key)
+            pl.zrevrange(self.key, start, end)
+            total_count, article_ids = pl.execute()
+        except ConnectionError as e:
+            current_app.logger.error(e)
+            pl = current_app.redis_slave.pipeline(transaction=False)
+            pl.zcard(self.key)
+            pl.zrevrange(self.key, start, end)
+            total_count, article_ids = pl.execute()
+
+        return total_count, [int(article_id) for article_id in article_ids]
+
+    @classmethod
+    def pop_queue(cls, count):
+        """
+        取出待持久化的阅读记录，多个进程同时取出时不会重复
+        :param count: 数量
+        :return: list [(user_id, article_id, timestamp)]
+        """
+        pl = current_app.redis_master.pipeline(transaction=True)
+        pl.lrange(cls.queue_key, 0, count - 1)
+        pl.ltrim(cls.queue_key, count, -1)
+        items, _ = pl.execute()
+
+        records = []
+        for item in items:
+            user_id, article_id, timestamp = item.decode().split(':')
+            records.append((int(user_id), int(article_id), float(timestamp)))
+        return records
+
+    @classmethod
+    def push_back_queue(cls, records):
+        """
+        持久化失败时将阅读记录放回队列头部
+        :param records: list [(user_id, article_id, timestamp)]
+        """
+        items = ['{}:{}:{}'.format(*record) for record in records]
+        current_app.redis_master.lpush(cls.queue_key, *reversed(items))
+
+    @classmethod
+    def dead_letter(cls, records, reason):
+        """
+        将数据错误无法写入的阅读记录移入死信队列，不再重试
+        :param records: list [(user_id, article_id, timestamp)]
+        :param reason: 原因
+        """
+        items = ['{}:{}:{}:{}'.format(*record, reason) for record in records]
+        pl = current_app.redis_master.pipeline(transaction=False)
+        pl.rpush(cls.dead_letter_key, *items)
+        pl.ltrim(cls.dead_letter_key, -constants.READING_HISTORY_DEAD_LETTER_MAX_LENGTH, -1)
+        pl.execute()
@@ -0,0 +1,29 @@
+# 响应时间、错误率指数加权移动平均的平滑系数
+HEALTH_EWMA_ALPHA = 0.2
+
+# 计算权重时响应时间的下限, 秒
+HEALTH_MIN_LATENCY = 0.001
+
+# 错误率超过此值时摘除从库
+HEALTH_MAX_ERROR_RATE = 0.5
+
+# 连续错误次数达到此值时摘除从库
+HEALTH_MAX_CONSECUTIVE_ERRORS = 3
+
+# 平均响应时间超过此值时摘除从库, 秒
+HEALTH_MAX_LATENCY = 1
+
+# 后台探测被摘除从库、采样从库复制延迟的间隔, 秒
+HEALTH_PROBE_INTERVAL = 5
+
+# 查询耗时直方图的桶上界, 秒
+METRICS_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# 保留的慢查询样本数量
+METRICS_SLOW_STATEMENT_SAMPLES = 100
+
+# 慢查询样本中语句的最大长度
+METRICS_SLOW_STATEMENT_MAX_LENGTH = 1000
+
+# 同一数据库连接池等待告警的最小间隔, 秒
+POOL_WAIT_WARNING_INTERVAL = 10
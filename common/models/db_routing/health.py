@@ -0,0 +1,208 @@
+import time
+import random
+import logging
+import threading
+from flask import has_request_context
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from . import constants
+
+
+logger = logging.getLogger('flask.app')
+
+
+class BindHealth(object):
+    """
+    数据库的健康状态
+    记录响应时间与错误率的指数加权移动平均，超过阈值时摘除
+    """
+    def __init__(self, bind, engine, weight=1):
+        """
+        初始化
+        :param bind: 数据库绑定名称
+        :param engine: 数据库引擎
+        :param weight: 配置的权重
+        """
+        self.bind = bind
+        self.engine = engine
+        self.weight = weight
+
+        self.latency = None
+        self.error_rate = 0.0
+        self.consecutive_errors = 0
+        self.ejected = False
+        self.lag = None
+        self.lagging = False
+        self._lock = threading.Lock()
+
+    @property
+    def effective_weight(self):
+        """
+        实际权重，与平均响应时间成反比，随错误率降低
+        """
+        latency = max(self.latency or constants.HEALTH_MIN_LATENCY, constants.HEALTH_MIN_LATENCY)
+        return self.weight / latency * (1 - self.error_rate)
+
+    def record_success(self, latency):
+        """
+        记录成功的查询
+        :param latency: 响应时间，秒
+        """
+        alpha = constants.HEALTH_EWMA_ALPHA
+        with self._lock:
+            self.latency = latency if self.latency is None else alpha * latency + (1 - alpha) * self.latency
+            self.error_rate = (1 - alpha) * self.error_rate
+            self.consecutive_errors = 0
+            if not self.ejected and self.latency > constants.HEALTH_MAX_LATENCY:
+                self._eject('latency {:.3f}s'.format(self.latency))
+
+    def record_error(self):
+        """
+        记录失败的查询
+        """
+        alpha = constants.HEALTH_EWMA_ALPHA
+        with self._lock:
+            self.error_rate = alpha + (1 - alpha) * self.error_rate
+            self.consecutive_errors += 1
+            if not self.ejected and (self.error_rate > constants.HEALTH_MAX_ERROR_RATE or
+                                     self.consecutive_errors >= constants.HEALTH_MAX_CONSECUTIVE_ERRORS):
+                self._eject('error_rate {:.2f} consecutive_errors {}'.format(
+                    self.error_rate, self.consecutive_errors))
+
+    def _eject(self, reason):
+        self.ejected = True
+        logger.warning('[DB] bind {} ejected: {}'.format(self.bind, reason))
+
+    def recover(self, latency):
+        """
+        探测成功后恢复
+        :param latency: 探测的响应时间，秒
+        """
+        with self._lock:
+            self.latency = latency
+            self.error_rate = 0.0
+            self.consecutive_errors = 0
+            self.ejected = False
+        logger.warning('[DB] bind {} recovered'.format(self.bind))
+
+
+class ReplicaSelector(object):
+    """
+    按健康状态加权选择从库，后台线程探测被摘除的从库，并采样从库的复制延迟
+    只统计请求中的查询，定时任务的批量查询耗时长，不反映从库的健康状态
+    """
+    def __init__(self, max_lag=None):
+        """
+        初始化
+        :param max_lag: 允许的最大复制延迟，秒，为None时不检查
+        """
+        self.max_lag = max_lag
+        self.healths = {}
+        self._thread = None
+
+    def add(self, bind, engine, weight=1):
+        """
+        添加从库，并监听其引擎的查询事件
+        :param bind: 数据库绑定名称
+        :param engine: 数据库引擎
+        :param weight: 配置的权重
+        """
+        if bind in self.healths:
+            return
+
+        health = BindHealth(bind, engine, weight)
+        self.healths[bind] = health
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            # 请求之外的查询（定时任务、后台线程）记为None，不统计
+            start_time = time.time() if has_request_context() else None
+            conn.info.setdefault('health_start_time', []).append(start_time)
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            start_times = conn.info.get('health_start_time')
+            start_time = start_times.pop() if start_times else None
+            if start_time is not None:
+                health.record_success(time.time() - start_time)
+
+        @event.listens_for(engine, 'handle_error')
+        def handle_error(context):
+            start_times = context.connection.info.get('health_start_time') if context.connection else None
+            start_time = start_times.pop() if start_times else None
+            # 断开连接总是统计，其他OperationalError（如批量查询超时）只统计请求中的查询
+            if context.is_disconnect or \
+                    (start_time is not None and isinstance(context.sqlalchemy_exception, OperationalError)):
+                health.record_error()
+
+    def start(self):
+        """
+        启动后台探测线程
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._probe, name='db-replica-probe', daemon=True)
+            self._thread.start()
+
+    def select(self, binds=None):
+        """
+        按实际权重随机选择一个未被摘除的从库
+        :param binds: 候选的数据库绑定名称，为None时从所有从库中选择
+        :return: 数据库绑定名称，没有可用从库时返回None
+        """
+        healths = self.healths.values() if binds is None else \
+            [self.healths[bind] for bind in binds if bind in self.healths]
+        candidates = [health for health in healths if not health.ejected and not health.lagging]
+        if not candidates:
+            return None
+
+        weights = [health.effective_weight for health in candidates]
+        point = random.uniform(0, sum(weights))
+        for health, weight in zip(candidates, weights):
+            point -= weight
+            if point <= 0:
+                return health.bind
+        return candidates[-1].bind
+
+    def _probe(self):
+        """
+        定期探测被摘除的从库，成功则恢复；采样从库复制延迟
+        """
+        while True:
+            time.sleep(constants.HEALTH_PROBE_INTERVAL)
+            for health in list(self.healths.values()):
+                if health.ejected:
+                    self._probe_ejected(health)
+                elif self.max_lag is not None:
+                    self._sample_lag(health)
+
+    def _probe_ejected(self, health):
+        start = time.time()
+        try:
+            with health.engine.connect() as conn:
+                conn.execute('SELECT 1')
+        except Exception as e:
+            logger.warning('[DB] bind {} probe failed: {}'.format(health.bind, e))
+            return
+        latency = time.time() - start
+        if latency <= constants.HEALTH_MAX_LATENCY:
+            health.recover(latency)
+
+    def _sample_lag(self, health):
+        """
+        采样复制延迟，复制中断（Seconds_Behind_Master为NULL）视为延迟过大
+        """
+        try:
+            with health.engine.connect() as conn:
+                row = conn.execute('SHOW SLAVE STATUS').first()
+        except Exception as e:
+            logger.warning('[DB] bind {} lag sample failed: {}'.format(health.bind, e))
+            return
+
+        lag = row['Seconds_Behind_Master'] if row is not None else 0
+        health.lag = lag
+        lagging = lag is None or lag > self.max_lag
+        if lagging != health.lagging:
+            health.lagging = lagging
+            logger.warning('[DB] bind {} {} lag {}'.format(
+                health.bind, 'lagging' if lagging else 'caught up', lag))
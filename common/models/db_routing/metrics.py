@@ -0,0 +1,154 @@
+import time
+import bisect
+import threading
+from collections import deque
+from flask import Response, request, abort
+from sqlalchemy import event
+
+from . import constants
+from .pool import pool_monitor
+
+
+class BindMetrics(object):
+    """
+    单个数据库绑定的查询指标
+    """
+    def __init__(self, bind):
+        self.bind = bind
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.time_sum = 0.0
+        # 最后一个桶为+Inf
+        self.buckets = [0] * (len(constants.METRICS_LATENCY_BUCKETS) + 1)
+
+
+class QueryMetrics(object):
+    """
+    进程内的数据库查询指标
+    通过引擎事件统计每个数据库绑定的查询次数、耗时分布、返回行数与错误次数，并采样慢查询，
+    未开启时不监听引擎事件，查询路径上没有额外开销
+    """
+    def __init__(self):
+        self.enabled = False
+        self.slow_threshold = None
+        self.allowed_ips = set()
+        self.slow_statements = deque(maxlen=constants.METRICS_SLOW_STATEMENT_SAMPLES)
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """
+        读取配置
+        :param app: Flask app对象
+        """
+        self.enabled = bool(app.config.get('SQLALCHEMY_METRICS_ENABLED'))
+        self.slow_threshold = app.config.get('SQLALCHEMY_SLOW_QUERY_THRESHOLD')
+        self.allowed_ips = set(app.config.get('SQLALCHEMY_METRICS_ALLOWED_IPS') or ())
+
+    def instrument(self, bind, engine):
+        """
+        监听数据库引擎的查询事件
+        :param bind: 数据库绑定名称
+        :param engine: 数据库引擎
+        """
+        if not self.enabled or bind in self._metrics:
+            return
+
+        metrics = BindMetrics(bind)
+        self._metrics[bind] = metrics
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('metrics_start_time', []).append(time.time())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            start_times = conn.info.get('metrics_start_time')
+            if start_times:
+                self._observe(metrics, time.time() - start_times.pop(), max(cursor.rowcount, 0), statement)
+
+        @event.listens_for(engine, 'handle_error')
+        def handle_error(context):
+            start_times = context.connection.info.get('metrics_start_time') if context.connection else None
+            if start_times:
+                start_times.pop()
+            with self._lock:
+                metrics.errors += 1
+
+    def _observe(self, metrics, elapsed, rows, statement):
+        index = bisect.bisect_left(constants.METRICS_LATENCY_BUCKETS, elapsed)
+        with self._lock:
+            metrics.count += 1
+            metrics.rows += rows
+            metrics.time_sum += elapsed
+            metrics.buckets[index] += 1
+
+        if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+            # 只保存语句，不保存参数
+            self.slow_statements.append({
+                'time': time.time(),
+                'bind': metrics.bind,
+                'elapsed': elapsed,
+                'rows': rows,
+                'statement': statement[:constants.METRICS_SLOW_STATEMENT_MAX_LENGTH],
+            })
+
+    def render(self):
+        """
+        生成文本格式（Prometheus exposition format）的指标
+        :return: str
+        """
+        with self._lock:
+            snapshot = [(m.bind, m.count, m.errors, m.rows, m.time_sum, list(m.buckets))
+                        for m in self._metrics.values()]
+
+        lines = [
+            '# HELP db_queries_total Number of statements executed.',
+            '# TYPE db_queries_total counter',
+        ]
+        lines.extend('db_queries_total{{bind="{}"}} {}'.format(s[0], s[1]) for s in snapshot)
+        lines.extend([
+            '# HELP db_query_errors_total Number of statements failed.',
+            '# TYPE db_query_errors_total counter',
+        ])
+        lines.extend('db_query_errors_total{{bind="{}"}} {}'.format(s[0], s[2]) for s in snapshot)
+        lines.extend([
+            '# HELP db_query_rows_total Number of rows returned or affected.',
+            '# TYPE db_query_rows_total counter',
+        ])
+        lines.extend('db_query_rows_total{{bind="{}"}} {}'.format(s[0], s[3]) for s in snapshot)
+        lines.extend([
+            '# HELP db_query_duration_seconds Statement execution time.',
+            '# TYPE db_query_duration_seconds histogram',
+        ])
+        for bind, count, _, _, time_sum, buckets in snapshot:
+            cumulative = 0
+            for bound, bucket in zip(constants.METRICS_LATENCY_BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket
+                lines.append('db_query_duration_seconds_bucket{{bind="{}",le="{}"}} {}'.format(
+                    bind, bound, cumulative))
+            lines.append('db_query_duration_seconds_sum{{bind="{}"}} {:.6f}'.format(bind, time_sum))
+            lines.append('db_query_duration_seconds_count{{bind="{}"}} {}'.format(bind, count))
+
+        lines.extend(pool_monitor.render())
+
+        for sample in list(self.slow_statements):
+            lines.append('# SLOW {} bind={} elapsed={:.3f}s rows={} {}'.format(
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(sample['time'])), sample['bind'],
+                sample['elapsed'], sample['rows'], ' '.join(sample['statement'].split())))
+
+        return '\n'.join(lines) + '\n'
+
+    def view(self):
+        """
+        指标接口视图函数
+        包含慢查询语句，只允许内网地址直接访问，经过反向代理转发的请求一律拒绝
+        """
+        if request.headers.get('X-Forwarded-For') or request.headers.get('X-Real-IP') or \
+                request.remote_addr not in self.allowed_ips:
+            abort(404)
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+query_metrics = QueryMetrics()
@@ -0,0 +1,191 @@
+import time
+import logging
+import threading
+from flask import request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+from . import constants
+
+
+logger = logging.getLogger('flask.app')
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    记录获取连接等待时间的连接池
+    """
+    stats = None
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            conn = QueuePool._do_get(self)
+        except TimeoutError:
+            if self.stats is not None:
+                self.stats.record_timeout(time.time() - start)
+            raise
+        if self.stats is not None:
+            self.stats.record_wait(time.time() - start)
+        return conn
+
+    def recreate(self):
+        pool = QueuePool.recreate(self)
+        pool.stats = self.stats
+        return pool
+
+
+def _current_holder():
+    """
+    获取连接的使用方，请求中为视图的endpoint，否则为线程名（如定时任务）
+    """
+    if has_request_context():
+        return request.endpoint or request.path
+    return threading.current_thread().name
+
+
+class BindPoolStats(object):
+    """
+    单个数据库绑定的连接池统计
+    """
+    def __init__(self, bind, engine, wait_warning=None):
+        """
+        初始化
+        :param bind: 数据库绑定名称
+        :param engine: 数据库引擎
+        :param wait_warning: 获取连接等待时间超过此值时告警，秒，为None时不告警
+        """
+        self.bind = bind
+        self.engine = engine
+        self.wait_warning = wait_warning
+
+        self.wait_count = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        # 已借出的连接 {id(connection_record): (holder, checkout_time)}
+        self.holders = {}
+        self._last_warning = 0
+        self._lock = threading.Lock()
+
+    def checkout(self, connection_record):
+        self.holders[id(connection_record)] = (_current_holder(), time.time())
+
+    def checkin(self, connection_record):
+        self.holders.pop(id(connection_record), None)
+
+    def record_wait(self, wait):
+        """
+        记录获取连接的等待时间
+        :param wait: 秒
+        """
+        with self._lock:
+            self.wait_count += 1
+            self.wait_sum += wait
+            self.wait_max = max(self.wait_max, wait)
+        if self.wait_warning is not None and wait >= self.wait_warning:
+            self._warn('waited {:.3f}s for a connection'.format(wait))
+
+    def record_timeout(self, wait):
+        """
+        记录获取连接超时
+        :param wait: 秒
+        """
+        with self._lock:
+            self.timeouts += 1
+        self._warn('timed out after {:.3f}s waiting for a connection'.format(wait))
+
+    def _warn(self, message):
+        now = time.time()
+        if now - self._last_warning < constants.POOL_WAIT_WARNING_INTERVAL:
+            return
+        self._last_warning = now
+
+        pool = self.engine.pool
+        logger.warning('[DB] bind {} {}, checked out {} overflow {}, held by {}'.format(
+            self.bind, message, pool.checkedout(), pool.overflow(), self.describe_holders(now)))
+
+    def describe_holders(self, now=None):
+        """
+        按使用方汇总已借出的连接
+        :return: str 如 "news.article x8 (longest 1.52s), APScheduler x1 (longest 0.03s)"
+        """
+        now = now or time.time()
+        summary = {}
+        for holder, since in list(self.holders.values()):
+            count, longest = summary.get(holder, (0, 0))
+            summary[holder] = (count + 1, max(longest, now - since))
+        items = sorted(summary.items(), key=lambda item: item[1], reverse=True)
+        return ', '.join('{} x{} (longest {:.2f}s)'.format(holder, count, longest)
+                         for holder, (count, longest) in items) or 'nobody'
+
+
+class PoolMonitor(object):
+    """
+    数据库连接池监控
+    """
+    def __init__(self):
+        self._stats = {}
+
+    def instrument(self, bind, engine, wait_warning=None):
+        """
+        监听数据库引擎连接池的借出与归还
+        :param bind: 数据库绑定名称
+        :param engine: 数据库引擎
+        :param wait_warning: 获取连接等待时间告警阈值，秒
+        """
+        if bind in self._stats:
+            return
+
+        stats = BindPoolStats(bind, engine, wait_warning)
+        self._stats[bind] = stats
+        if isinstance(engine.pool, InstrumentedQueuePool):
+            engine.pool.stats = stats
+
+        @event.listens_for(engine, 'checkout')
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            stats.checkout(connection_record)
+
+        @event.listens_for(engine, 'checkin')
+        def checkin(dbapi_connection, connection_record):
+            stats.checkin(connection_record)
+
+    def render(self):
+        """
+        生成文本格式（Prometheus exposition format）的指标
+        :return: list 指标行
+        """
+        gauges = []
+        for stats in list(self._stats.values()):
+            pool = stats.engine.pool
+            sized = isinstance(pool, QueuePool)
+            gauges.append((stats, {
+                'db_pool_size': pool.size() if sized else 0,
+                'db_pool_checked_out': pool.checkedout() if sized else len(stats.holders),
+                'db_pool_overflow': max(pool.overflow(), 0) if sized else 0,
+                'db_pool_wait_seconds_max': stats.wait_max,
+            }))
+
+        lines = []
+        for name, help_text in (('db_pool_size', 'Configured pool size.'),
+                                ('db_pool_checked_out', 'Connections currently checked out.'),
+                                ('db_pool_overflow', 'Overflow connections currently open.'),
+                                ('db_pool_wait_seconds_max', 'Longest wait for a connection.')):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} gauge'.format(name))
+            lines.extend('{}{{bind="{}"}} {}'.format(name, stats.bind, values[name]) for stats, values in gauges)
+
+        lines.append('# HELP db_pool_wait_seconds Time spent waiting for a connection.')
+        lines.append('# TYPE db_pool_wait_seconds summary')
+        for stats, _ in gauges:
+            lines.append('db_pool_wait_seconds_sum{{bind="{}"}} {:.6f}'.format(stats.bind, stats.wait_sum))
+            lines.append('db_pool_wait_seconds_count{{bind="{}"}} {}'.format(stats.bind, stats.wait_count))
+        lines.append('# HELP db_pool_timeouts_total Connection checkouts that timed out.')
+        lines.append('# TYPE db_pool_timeouts_total counter')
+        lines.extend('db_pool_timeouts_total{{bind="{}"}} {}'.format(stats.bind, stats.timeouts)
+                     for stats, _ in gauges)
+        return lines
+
+
+pool_monitor = PoolMonitor()
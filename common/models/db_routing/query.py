@@ -0,0 +1,30 @@
+from flask_sqlalchemy import BaseQuery
+
+from .sharding import ShardMap, ShardRoutingError
+
+
+class RoutingQuery(BaseQuery):
+    """
+    补充路由的query
+    获取数据库绑定时传入查询参数，延迟加载等使用params()设置的分片字段值也能用于分片路由
+    """
+    def _get_bind_args(self, querycontext, fn, **kw):
+        return fn(
+            mapper=self._bind_mapper(),
+            clause=querycontext.statement,
+            params=self._params,
+            **kw
+        )
+
+    def get(self, ident):
+        """
+        按主键查询
+        分片模型的主键不包含分片字段，只能在已设置分片时（session.set_shard、db.scatter_gather中）使用，
+        否则应使用 filter_by(分片字段=.., id=..)
+        """
+        mapper = self._mapper_zero()
+        shard_key = ShardMap.shard_key(mapper)
+        if shard_key and getattr(self.session, '_shard_id', None) is None:
+            raise ShardRoutingError('{0}.get() cannot be routed by primary key, '
+                                    'use filter_by({1}=.., id=..) instead.'.format(mapper.class_.__name__, shard_key))
+        return super().get(ident)
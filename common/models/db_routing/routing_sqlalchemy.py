@@ -1,8 +1,14 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import orm
+from sqlalchemy.engine.url import make_url
 import random
 
 from .session import RoutingSession
+from .query import RoutingQuery
+from .health import ReplicaSelector
+from .metrics import query_metrics
+from .pool import InstrumentedQueuePool, pool_monitor
+from .sharding import ShardMap
 
 
 class RoutingSQLAlchemy(SQLAlchemy):
@@ -12,6 +18,12 @@ class RoutingSQLAlchemy(SQLAlchemy):
     master_binds = []
     slave_binds = []
     default_bind = ''
+    replica_selector = None
+    shard_map = None
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('query_class', RoutingQuery)
+        SQLAlchemy.__init__(self, *args, **kwargs)
 
     def create_session(self, options):
         return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -26,12 +38,47 @@ class RoutingSQLAlchemy(SQLAlchemy):
         self.slave_binds = list(config_binds.get('slaves') or ())
         self.default_bind = config_binds.get('default')
 
+        # 按用户id分片的数据库，如 [{'masters': ['bj-m1'], 'slaves': ['bj-s1']}, ..]
+        if self.shard_map is None and app.config.get('SQLALCHEMY_SHARDS'):
+            self.shard_map = ShardMap(app.config['SQLALCHEMY_SHARDS'])
+        shard_binds = self.shard_map.binds if self.shard_map else []
+
         binds = self.master_binds + self.slave_binds
+        binds.extend(bind for bind in shard_binds if bind not in binds)
+        wait_warning = app.config.get('SQLALCHEMY_POOL_WAIT_WARNING')
         for bind in binds:
-            self.get_engine(app, bind)
+            engine = self.get_engine(app, bind)
+            query_metrics.instrument(bind, engine)
+            pool_monitor.instrument(bind, engine, wait_warning)
+
+        if self.replica_selector is None:
+            # 从库权重，如 {'bj-s1': 1, 'bj-s2': 2}，未配置的从库权重为1
+            weights = config_binds.get('weights') or {}
+            selector = ReplicaSelector(app.config.get('SQLALCHEMY_MAX_REPLICA_LAG'))
+            shard_slaves = [bind for shard in self.shard_map.shards for bind in shard.slaves] if self.shard_map else []
+            for bind in self.slave_binds + shard_slaves:
+                selector.add(bind, self.get_engine(app, bind), weights.get(bind, 1))
+            selector.start()
+            self.replica_selector = selector
 
         return {}
 
+    def apply_driver_hacks(self, app, info, options):
+        """
+        补充连接池配置
+        按数据库地址找到对应的绑定，使用SQLALCHEMY_BINDS中pools的配置，
+        如 {'bj-m1': {'pool_size': 10, 'max_overflow': 5, 'pool_recycle': 3600, 'pool_pre_ping': True}}
+        """
+        config_binds = app.config.get('SQLALCHEMY_BINDS') or {}
+        pools = config_binds.get('pools') or {}
+        for bind, pool_options in pools.items():
+            if make_url(config_binds[bind]) == info:
+                options.update(pool_options)
+                break
+
+        options.setdefault('poolclass', InstrumentedQueuePool)
+        SQLAlchemy.apply_driver_hacks(self, app, info, options)
+
     def get_bind_for_write(self):
         """
         获取写使用的数据库
@@ -41,5 +88,18 @@ class RoutingSQLAlchemy(SQLAlchemy):
     def get_bind_for_read(self):
         """
         获取读使用的数据库
+        按从库的响应时间、错误率与配置的权重选择，从库都不可用时使用主库
+        """
+        bind = self.replica_selector.select(self.slave_binds) if self.replica_selector else None
+        return bind or self.get_bind_for_write()
+
+    def scatter_gather(self, func, read=True):
+        """
+        在每个分片上执行查询，用于不按分片字段过滤的分片模型查询
+        :param func: 查询函数，参数为(session, shard_id)，返回该分片的结果
+        :param read: 是否使用从库
+        :return: list 每个分片的结果
         """
-        return random.choice(self.slave_binds)
+        if self.shard_map is None:
+            return [func(self.session(), None)]
+        return self.shard_map.scatter_gather(self.get_app(), self.create_session({'query_cls': self.Query}), func, read)
@@ -1,4 +1,7 @@
 from flask_sqlalchemy import SignallingSession, get_state
+from sqlalchemy import event
+
+from . import sticky
 
 
 class RoutingSession(SignallingSession):
@@ -7,25 +10,47 @@ class RoutingSession(SignallingSession):
     """
     def __init__(self, db, bind_name=None, autocommit=False, autoflush=True, **options):
         self._name = bind_name
+        self._for_read = False
+        self._shard_id = None
+        self._has_writes = False
         SignallingSession.__init__(self, db, autocommit=autocommit, autoflush=autoflush, **options)
 
-    def get_bind(self, mapper=None, clause=None):
+    def get_bind(self, mapper=None, clause=None, shard_id=None, instance=None, params=None, **kw):
         """
         获取数据库绑定
+        分片模型按分片字段路由到所在分片，写入对象时使用对象的分片字段，查询时使用查询条件中的分片字段
         """
-        # For test
-        print('Calling get_bind: _name={}'.format(self._name))
-
         state = get_state(self.app)
+        shard_map = state.db.shard_map
+        if shard_map is not None and mapper is not None and shard_map.shard_key(mapper):
+            if shard_id is None:
+                shard_id = self._shard_id
+            if shard_id is None:
+                if instance is not None:
+                    shard_id = shard_map.shard_for_instance(mapper, instance)
+                else:
+                    shard_id = shard_map.shard_for_clause(mapper, clause, params)
 
-        if self._name:
-            # 指定
-            print('Using DB bind: _name={}'.format(self._name))
-            return state.db.get_engine(self.app, bind=self._name)
-        else:
-            # 默认数据库
-            print('Using default DB bind: _name={}'.format(state.db.default_bind))
-            return state.db.get_engine(self.app, bind=state.db.default_bind)
+            shard = shard_map.shards[shard_id]
+            if self._for_read and instance is None:
+                bind = shard.get_bind_for_read(state.db.replica_selector)
+            else:
+                bind = shard.get_bind_for_write()
+            return state.db.get_engine(self.app, bind=bind)
+
+        return state.db.get_engine(self.app, bind=self._name or state.db.default_bind)
+
+    def _connection_for_instance(self, mapper, instance):
+        """
+        flush时按对象获取连接
+        """
+        return self.connection(mapper, instance=instance)
+
+    def set_shard(self, shard_id):
+        """
+        设置分片模型使用的分片，为None时按分片字段路由
+        """
+        self._shard_id = shard_id
 
     def set_to_write(self):
         """
@@ -34,11 +59,52 @@ class RoutingSession(SignallingSession):
         state = get_state(self.app)
 
         self._name = state.db.get_bind_for_write()
+        self._for_read = False
 
     def set_to_read(self):
         """
         设置用读数据库
+        当前用户刚写入过主库时仍使用主库，避免读到从库未同步的旧数据
         """
         state = get_state(self.app)
 
-        self._name = state.db.get_bind_for_read()
+        if sticky.is_recently_written(self.app):
+            self._name = state.db.get_bind_for_write()
+            self._for_read = False
+        else:
+            self._name = state.db.get_bind_for_read()
+            self._for_read = True
+
+    def commit(self):
+        """
+        提交，有写入时记录当前用户的写入时间
+        """
+        SignallingSession.commit(self)
+        if self._has_writes:
+            self._has_writes = False
+            sticky.mark_written(self.app)
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _before_flush(session, flush_context, instances):
+    # 有分片模型时按对象选择连接，bulk操作不支持按对象选择连接，仅在flush期间设置
+    shard_map = get_state(session.app).db.shard_map
+    if shard_map is not None and any(shard_map.shard_key(type(obj))
+                                     for obj in set(session.new) | set(session.dirty) | set(session.deleted)):
+        session.connection_callable = session._connection_for_instance
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    session._has_writes = True
+
+
+@event.listens_for(RoutingSession, 'after_flush_postexec')
+def _after_flush_postexec(session, flush_context):
+    session.connection_callable = None
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _after_rollback(session):
+    session._has_writes = False
+    session.connection_callable = None
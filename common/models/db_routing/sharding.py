@@ -0,0 +1,158 @@
+import zlib
+import random
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.elements import BindParameter
+
+
+class ShardRoutingError(RuntimeError):
+    """
+    无法确定分片
+    """
+    pass
+
+
+class Shard(object):
+    """
+    一个分片，包含一组主从数据库
+    """
+    def __init__(self, shard_id, masters, slaves):
+        self.shard_id = shard_id
+        self.masters = list(masters)
+        self.slaves = list(slaves or ())
+
+    def get_bind_for_write(self):
+        return random.choice(self.masters)
+
+    def get_bind_for_read(self, replica_selector=None):
+        """
+        按从库健康状态选择，从库都不可用时使用主库
+        """
+        bind = replica_selector.select(self.slaves) if replica_selector and self.slaves else None
+        return bind or self.get_bind_for_write()
+
+
+class ShardMap(object):
+    """
+    按用户id水平分片的路由表
+    模型类通过 __shard_key__ 指定分片字段，分片 = crc32(分片字段值) % 分片数量，
+    雪花id的低位是毫秒内的序号，大多为0，需先散列再取模；分片数量变化时需要迁移数据
+    """
+    def __init__(self, shards):
+        """
+        初始化
+        :param shards: list [{'masters': [bind, ..], 'slaves': [bind, ..]}]，下标即分片id
+        """
+        if not shards:
+            raise ValueError('At least one shard is required.')
+        self.shards = [Shard(shard_id, shard['masters'], shard.get('slaves'))
+                       for shard_id, shard in enumerate(shards)]
+        self._executor = None
+
+    def __len__(self):
+        return len(self.shards)
+
+    @property
+    def binds(self):
+        """
+        所有分片使用的数据库绑定名称
+        """
+        binds = []
+        for shard in self.shards:
+            binds.extend(bind for bind in shard.masters + shard.slaves if bind not in binds)
+        return binds
+
+    def shard_for(self, value):
+        """
+        计算分片
+        :param value: 分片字段值
+        :return: 分片id
+        """
+        return zlib.crc32(str(int(value)).encode()) % len(self.shards)
+
+    @staticmethod
+    def shard_key(mapper):
+        """
+        获取模型的分片字段
+        :param mapper: Mapper或模型类
+        :return: 属性名，未分片时返回None
+        """
+        return getattr(getattr(mapper, 'class_', mapper), '__shard_key__', None)
+
+    def shard_for_instance(self, mapper, instance):
+        """
+        根据对象的分片字段计算分片
+        """
+        key = self.shard_key(mapper)
+        value = getattr(instance, key)
+        if value is None:
+            raise ShardRoutingError('{}.{} is required for sharding.'.format(type(instance).__name__, key))
+        return self.shard_for(value)
+
+    def shard_for_clause(self, mapper, clause, params=None):
+        """
+        根据查询条件中的分片字段（== 或 IN）计算分片
+        :param mapper: Mapper
+        :param clause: 查询语句
+        :param params: 执行时的参数，覆盖语句中绑定参数的值
+        :return: 分片id
+        """
+        key = self.shard_key(mapper)
+        column = mapper.columns[key]
+        values = set()
+
+        def visit_binary(binary):
+            if binary.operator not in (operators.eq, operators.in_op):
+                return
+            if isinstance(binary.left, BindParameter) and binary.right.shares_lineage(column):
+                side = binary.left
+            elif hasattr(binary.left, 'shares_lineage') and binary.left.shares_lineage(column):
+                side = binary.right
+            else:
+                return
+            for element in visitors.iterate(side, {}):
+                if isinstance(element, BindParameter):
+                    value = params[element.key] if params and element.key in params else element.effective_value
+                    values.update(value if isinstance(value, (list, tuple, set)) else (value,))
+
+        if clause is not None:
+            visitors.traverse(clause, {}, {'binary': visit_binary})
+
+        shard_ids = {self.shard_for(value) for value in values if value is not None}
+        if len(shard_ids) != 1:
+            raise ShardRoutingError('Cannot route {} query by {}: {} shards matched, '
+                                    'use db.scatter_gather for cross-shard reads.'.format(
+                                        mapper.class_.__name__, key, len(shard_ids)))
+        return shard_ids.pop()
+
+    def scatter_gather(self, app, session_factory, func, read=True):
+        """
+        在每个分片上执行查询并收集结果
+        :param app: Flask app对象
+        :param session_factory: 创建RoutingSession的函数
+        :param func: 查询函数，参数为(session, shard_id)，session的分片查询都路由到shard_id
+        :param read: 是否使用从库
+        :return: list 每个分片的结果，按分片id排列
+        """
+        if len(self.shards) == 1:
+            return [self._run_on_shard(app, session_factory, func, read, 0)]
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(len(self.shards), thread_name_prefix='db-scatter')
+        futures = [self._executor.submit(self._run_on_shard, app, session_factory, func, read, shard.shard_id)
+                   for shard in self.shards]
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def _run_on_shard(app, session_factory, func, read, shard_id):
+        with app.app_context():
+            session = session_factory()
+            try:
+                session.set_shard(shard_id)
+                if read:
+                    session.set_to_read()
+                else:
+                    session.set_to_write()
+                return func(session, shard_id)
+            finally:
+                session.close()
@@ -0,0 +1,64 @@
+from flask import g, has_request_context
+from redis.exceptions import RedisError
+
+from . import constants
+
+
+def _key(user_id):
+    return 'user:{}:db:written'.format(user_id)
+
+
+def _current_user_id():
+    if not has_request_context():
+        return None
+    return g.get('user_id')
+
+
+def _window(app):
+    """
+    使用主库的时间窗口, 秒
+    不小于允许的最大复制延迟加上延迟采样间隔，窗口结束后仍可用的从库一定已同步到写入时的数据
+    :param app: Flask app对象
+    :return: int 为0时关闭
+    """
+    window = app.config.get('SQLALCHEMY_STICKY_WRITE_SECONDS')
+    max_lag = app.config.get('SQLALCHEMY_MAX_REPLICA_LAG')
+    if not window or max_lag is None:
+        return window
+    return max(window, max_lag + constants.HEALTH_PROBE_INTERVAL)
+
+
+def mark_written(app):
+    """
+    记录当前用户刚刚写入了主库，在时间窗口内该用户的读请求使用主库
+    :param app: Flask app对象
+    """
+    window = _window(app)
+    user_id = _current_user_id()
+    if not window or not user_id:
+        return
+
+    try:
+        app.redis_cluster.setex(_key(user_id), window, 1)
+    except RedisError as e:
+        app.logger.error(e)
+
+
+def is_recently_written(app):
+    """
+    判断当前用户是否在时间窗口内写入过主库
+    :param app: Flask app对象
+    :return: bool
+    """
+    if not app.config.get('SQLALCHEMY_STICKY_WRITE_SECONDS'):
+        return False
+
+    user_id = _current_user_id()
+    if not user_id:
+        return False
+
+    try:
+        return bool(app.redis_cluster.exists(_key(user_id)))
+    except RedisError as e:
+        app.logger.error(e)
+        return False
@@ -90,14 +90,16 @@ CREATE TABLE `user_profile` (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8 COMMENT='用户资料表';
 
 CREATE TABLE `user_relation` (
-  `relation_id` bigint(20) unsigned NOT NULL AUTO_INCREMENT COMMENT '主键id',
+  `relation_id` bigint(20) unsigned NOT NULL COMMENT '主键id，snowflake生成，跨分片唯一',
   `user_id` bigint(20) unsigned NOT NULL COMMENT '用户ID',
   `target_user_id` bigint(20) unsigned NOT NULL COMMENT '目标用户ID',
   `relation` tinyint(1) NOT NULL DEFAULT '0' COMMENT '关系，0-取消，1-关注，2-拉黑',
   `create_time` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
   `update_time` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
   PRIMARY KEY (`relation_id`),
-  UNIQUE KEY `user_target` (`user_id`, `target_user_id`)
+  UNIQUE KEY `user_target` (`user_id`, `target_user_id`),
+  KEY `user_relation_time` (`user_id`, `relation`, `update_time`),
+  KEY `target_relation_time` (`target_user_id`, `relation`, `update_time`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8 COMMENT='用户关系表';
 
 CREATE TABLE `user_search` (
@@ -108,7 +110,7 @@ CREATE TABLE `user_search` (
   `is_deleted` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否删除, 0-未删除，1-已删除',
   `update_time` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
   PRIMARY KEY (`search_id`),
-  KEY `user_id` (`user_id`)
+  KEY `user_deleted_time` (`user_id`, `is_deleted`, `create_time`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8 COMMENT='用户搜索历史';
 
 CREATE TABLE `user_material` (
@@ -202,29 +204,29 @@ CREATE TABLE `news_article_statistic` (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8 COMMENT='文章统计表';
 
 CREATE TABLE `news_collection` (
-  `collection_id` bigint(20) unsigned NOT NULL AUTO_INCREMENT COMMENT '主键id',
+  `collection_id` bigint(20) unsigned NOT NULL COMMENT '主键id，snowflake生成，跨分片唯一',
   `user_id` bigint(20) unsigned NOT NULL COMMENT '用户ID',
   `article_id` bigint(20) unsigned NOT NULL COMMENT '文章ID',
   `create_time` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
   `is_deleted` tinyint(1) NOT NULL DEFAULT '0' COMMENT '是否取消收藏, 0-未取消, 1-已取消',
   `update_time` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
   PRIMARY KEY (`collection_id`),
-  UNIQUE KEY `user_article` (`user_id`, `article_id`)
+  UNIQUE KEY `user_article` (`user_id`, `article_id`),
+  KEY `user_deleted_time` (`user_id`, `is_deleted`, `update_time`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8 COMMENT='用户收藏表';
 
-# 已废弃
-# CREATE TABLE `news_read` (
-#   `read_id` bigint(20) unsigned NOT NULL AUTO_INCREMENT COMMENT '主键id',
-#   `user_id` bigint(20) unsigned NOT NULL COMMENT '用户ID',
-#   `article_id` bigint(20) unsigned NOT NULL COMMENT '文章ID',
-#   `create_time` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
-#   `update_time` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
-#   PRIMARY KEY (`read_id`),
-#   UNIQUE KEY `user_article` (`user_id`, `article_id`)
-# ) ENGINE=InnoDB DEFAULT CHARSET=utf8 COMMENT='用户阅读历史';
+CREATE TABLE `news_read` (
+  `read_id` bigint(20) unsigned NOT NULL AUTO_INCREMENT COMMENT '主键id',
+  `user_id` bigint(20) unsigned NOT NULL COMMENT '用户ID',
+  `article_id` bigint(20) unsigned NOT NULL COMMENT '文章ID',
+  `create_time` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+  `update_time` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+  PRIMARY KEY (`read_id`),
+  UNIQUE KEY `user_article` (`user_id`, `article_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COMMENT='用户阅读历史';
 
 CREATE TABLE `news_attitude` (
-  `attitude_id` bigint(20) unsigned NOT NULL AUTO_INCREMENT COMMENT '主键id',
+  `attitude_id` bigint(20) unsigned NOT NULL COMMENT '主键id，snowflake生成，跨分片唯一',
   `user_id` bigint(20) unsigned NOT NULL COMMENT '用户ID',
   `article_id` bigint(20) unsigned NOT NULL COMMENT '文章ID',
   `attitude` tinyint(1) NULL COMMENT '态度，0-不喜欢，1-喜欢',
@@ -262,7 +264,7 @@ CREATE TABLE `news_comment` (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8 COMMENT='文章评论';
 
 CREATE TABLE `news_comment_liking` (
-  `liking_id` bigint(20) unsigned NOT NULL AUTO_INCREMENT COMMENT '主键id',
+  `liking_id` bigint(20) unsigned NOT NULL COMMENT '主键id，snowflake生成，跨分片唯一',
   `user_id` bigint(20) unsigned NOT NULL COMMENT '用户ID',
   `comment_id` bigint(20) unsigned NOT NULL COMMENT '评论ID',
   `create_time` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
@@ -1,6 +1,7 @@
 from datetime import datetime
 
 from . import db
+from .snowflake import generate_id
 
 
 class Channel(db.Model):
@@ -103,9 +104,10 @@ class Collection(db.Model):
     """
     用户收藏表
     """
+    __shard_key__ = 'user_id'  # 按用户id分片
     __tablename__ = 'news_collection'
 
-    id = db.Column('collection_id', db.Integer, primary_key=True, doc='主键ID')
+    id = db.Column('collection_id', db.Integer, primary_key=True, default=generate_id, doc='主键ID，snowflake生成，跨分片唯一')
     user_id = db.Column(db.Integer, doc='用户ID')
     article_id = db.Column(db.Integer, doc='文章ID')
     ctime = db.Column('create_time', db.DateTime, default=datetime.now, doc='创建时间')
@@ -116,7 +118,7 @@ class Collection(db.Model):
 class Read(db.Model):
     """
     用户阅读历史表
-    ******************已废弃****************
+    阅读历史读写使用redis，此表由定时任务批量写入，仅供统计分析使用
     """
     __tablename__ = 'news_read'
 
@@ -131,20 +133,23 @@ class Attitude(db.Model):
     """
     用户文章态度表
     """
+    __shard_key__ = 'user_id'  # 按用户id分片
     __tablename__ = 'news_attitude'
 
     class ATTITUDE:
         DISLIKE = 0  # 不喜欢
         LIKING = 1  # 点赞
 
-    id = db.Column('attitude_id', db.Integer, primary_key=True, doc='主键ID')
+    id = db.Column('attitude_id', db.Integer, primary_key=True, default=generate_id, doc='主键ID，snowflake生成，跨分片唯一')
     user_id = db.Column(db.Integer, doc='用户ID')
-    article_id = db.Column(db.Integer, db.ForeignKey('news_article_basic.article_id'), doc='文章ID')
+    article_id = db.Column(db.Integer, doc='文章ID')
     attitude = db.Column(db.Boolean, doc='态度')
     ctime = db.Column('create_time', db.DateTime, default=datetime.now, doc='创建时间')
     utime = db.Column('update_time', db.DateTime, default=datetime.now, onupdate=datetime.now, doc='更新时间')
 
-    article = db.relationship('Article', uselist=False)
+    # 文章表不分片，与点赞记录不在同一数据库，只能单独查询，不能使用joinedload等关联查询
+    article = db.relationship('Article', primaryjoin='foreign(Attitude.article_id) == Article.id',
+                              uselist=False, viewonly=True, lazy='select')
 
 
 class Report(db.Model):
@@ -197,9 +202,10 @@ class CommentLiking(db.Model):
     """
     评论点赞
     """
+    __shard_key__ = 'user_id'  # 按用户id分片
     __tablename__ = 'news_comment_liking'
 
-    id = db.Column('liking_id', db.Integer, primary_key=True, doc='主键ID')
+    id = db.Column('liking_id', db.Integer, primary_key=True, default=generate_id, doc='主键ID，snowflake生成，跨分片唯一')
     user_id = db.Column(db.Integer, doc='用户ID')
     comment_id = db.Column(db.Integer, doc='评论ID')
     ctime = db.Column('create_time', db.DateTime, default=datetime.now, doc='创建时间')
@@ -0,0 +1,139 @@
+import json
+import base64
+import binascii
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+from . import db
+from .news import Comment, Collection
+from .user import Relation, Search
+
+
+class InvalidCursor(ValueError):
+    """
+    无法解析的分页游标
+    """
+    pass
+
+
+class KeysetPaginator(object):
+    """
+    游标分页（keyset pagination）
+    按排序字段（如 (ctime, id) 或单独的snowflake id）倒序分页，下一页的条件为排序字段小于上一页最后一条数据，
+    配合以过滤字段开头、排序字段结尾的索引，任意深度的分页都只扫描一页数据。
+    游标为上一页最后一条数据排序字段值的编码，对客户端不透明
+    """
+    DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+    def __init__(self, *columns):
+        """
+        初始化
+        :param columns: 排序字段，最后一个字段必须唯一（如主键），按倒序排列
+        """
+        self.columns = columns
+
+    def encode_cursor(self, item):
+        """
+        生成游标
+        :param item: 一页中的最后一条数据
+        :return: str
+        """
+        values = []
+        for column in self.columns:
+            value = getattr(item, column.key)
+            values.append(value.strftime(self.DATETIME_FORMAT) if isinstance(value, datetime) else value)
+        data = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+    def decode_cursor(self, cursor):
+        """
+        解析游标
+        :param cursor: str
+        :return: list 排序字段值
+        """
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            values = json.loads(data.decode())
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise InvalidCursor('Invalid cursor.')
+        if not isinstance(values, list) or len(values) != len(self.columns):
+            raise InvalidCursor('Invalid cursor.')
+
+        try:
+            return [datetime.strptime(value, self.DATETIME_FORMAT)
+                    if isinstance(column.property.columns[0].type, db.DateTime) else int(value)
+                    for column, value in zip(self.columns, values)]
+        except (TypeError, ValueError):
+            raise InvalidCursor('Invalid cursor.')
+
+    def after(self, values):
+        """
+        生成下一页的查询条件
+        (a, b) < (x, y) 展开为 a <= x AND (a < x OR b < y)，第一个字段可以使用索引范围扫描
+        :param values: 排序字段值
+        """
+        def condition(index):
+            column, value = self.columns[index], values[index]
+            if index == len(self.columns) - 1:
+                return column < value
+            return and_(column <= value, or_(column < value, condition(index + 1)))
+        return condition(0)
+
+    def order_by(self):
+        return [column.desc() for column in self.columns]
+
+    def paginate(self, query, cursor=None, limit=10):
+        """
+        分页查询
+        :param query: 已设置过滤条件的查询
+        :param cursor: 游标，为None时查询第一页
+        :param limit: 每页数量
+        :return: (items, next_cursor) next_cursor为None表示没有更多数据
+        """
+        if cursor:
+            query = query.filter(self.after(self.decode_cursor(cursor)))
+        items = query.order_by(*self.order_by()).limit(limit + 1).all()
+        return self._page(items, limit)
+
+    def paginate_shards(self, query_func, cursor=None, limit=10):
+        """
+        在所有分片上分页查询并合并，用于不按分片字段过滤的分片模型（如粉丝列表）
+        每个分片查询一页，按排序字段合并后取一页
+        :param query_func: 参数为session，返回已设置过滤条件的查询
+        :param cursor: 游标
+        :param limit: 每页数量
+        :return: (items, next_cursor)
+        """
+        values = self.decode_cursor(cursor) if cursor else None
+
+        def query_shard(session, shard_id=None):
+            query = query_func(session)
+            if values is not None:
+                query = query.filter(self.after(values))
+            items = query.order_by(*self.order_by()).limit(limit + 1).all()
+            # 在分片session关闭前从session中移除，返回的对象可以继续访问已加载的字段
+            session.expunge_all()
+            return items
+
+        items = [item for items in db.scatter_gather(query_shard) for item in items]
+        items.sort(key=lambda item: [getattr(item, column.key) for column in self.columns], reverse=True)
+        return self._page(items, limit)
+
+    def _page(self, items, limit):
+        if len(items) > limit:
+            items = items[:limit]
+            return items, self.encode_cursor(items[-1])
+        return items, None
+
+
+# 评论、回复列表，按snowflake id倒序，使用 (article_id) / (parent_id) 索引
+comment_paginator = KeysetPaginator(Comment.id)
+
+# 关注、粉丝列表，按关注时间倒序，使用 (user_id, relation, update_time) / (target_user_id, relation, update_time) 索引
+relation_paginator = KeysetPaginator(Relation.utime, Relation.id)
+
+# 收藏列表，按收藏时间倒序，使用 (user_id, is_deleted, update_time) 索引
+collection_paginator = KeysetPaginator(Collection.utime, Collection.id)
+
+# 搜索历史，按搜索时间倒序，使用 (user_id, is_deleted, create_time) 索引
+search_paginator = KeysetPaginator(Search.ctime, Search.id)
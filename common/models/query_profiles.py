@@ -0,0 +1,157 @@
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import load_only, joinedload, selectinload
+
+from .news import Article, ArticleContent, Channel, Comment
+from .user import User
+
+
+class LoadProfile(object):
+    """
+    查询的加载方案
+    指定查询的字段与关联关系的加载方式，避免逐行延迟加载关联对象（N+1查询）
+    """
+    def __init__(self, name, build_options, queries, doc=''):
+        """
+        初始化
+        :param name: 名称
+        :param build_options: 生成查询选项的函数，在首次使用时调用，此时模型映射已完成
+        :param queries: 使用此方案查询一页数据的SQL语句数量，与数据数量无关
+        :param doc: 说明
+        """
+        self.name = name
+        self.build_options = build_options
+        self.queries = queries
+        self.doc = doc
+        self._options = None
+
+    @property
+    def options(self):
+        if self._options is None:
+            self._options = self.build_options()
+        return self._options
+
+    def apply(self, query):
+        return query.options(*self.options)
+
+
+PROFILES = {}
+
+
+def register(profile):
+    PROFILES[profile.name] = profile
+    return profile
+
+
+def apply_profile(query, name):
+    """
+    使用加载方案
+    :param query: 查询
+    :param name: 方案名称
+    :return: 查询
+    """
+    return PROFILES[name].apply(query)
+
+
+# 作者信息只需要展示字段
+def _author_fields(relationship):
+    return relationship.load_only(User.id, User.name, User.profile_photo)
+
+
+register(LoadProfile(
+    'feed_card',
+    lambda: (
+        load_only(Article.id, Article.user_id, Article.channel_id, Article.title, Article.cover,
+                  Article.ctime, Article.comment_count, Article.allow_comment),
+        _author_fields(joinedload(Article.user)),
+    ),
+    queries=1,
+    doc='文章列表卡片：文章基本信息与作者，一次关联查询'
+))
+
+register(LoadProfile(
+    'article_detail',
+    lambda: (
+        load_only(Article.id, Article.user_id, Article.channel_id, Article.title, Article.cover,
+                  Article.ctime, Article.allow_comment),
+        joinedload(Article.content, innerjoin=True).load_only(ArticleContent.content),
+        _author_fields(joinedload(Article.user)),
+        joinedload(Article.channel).load_only(Channel.id, Channel.name),
+    ),
+    queries=1,
+    doc='文章详情：文章基本信息、内容、作者与频道，一次关联查询'
+))
+
+register(LoadProfile(
+    'comment_item',
+    lambda: (
+        load_only(Comment.id, Comment.user_id, Comment.article_id, Comment.parent_id, Comment.like_count,
+                  Comment.reply_count, Comment.content, Comment.is_top, Comment.status, Comment.ctime),
+        _author_fields(joinedload(Comment.user)),
+    ),
+    queries=1,
+    doc='评论列表项：评论与评论人，一次关联查询'
+))
+
+register(LoadProfile(
+    'user_comment_item',
+    lambda: (
+        load_only(Comment.id, Comment.user_id, Comment.article_id, Comment.parent_id, Comment.like_count,
+                  Comment.reply_count, Comment.content, Comment.status, Comment.ctime),
+        selectinload(Comment.article).load_only(Article.id, Article.title, Article.cover),
+    ),
+    queries=2,
+    doc='用户的评论列表项：评论与所属文章，文章较少重复，使用IN查询批量加载'
+))
+
+
+class QueryCounter(object):
+    """
+    当前线程执行的SQL语句计数
+    """
+    def __init__(self):
+        self.statements = []
+        self._thread = threading.current_thread()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.current_thread() is self._thread:
+            self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries():
+    """
+    统计上下文中当前线程执行的SQL语句
+    用法：
+        with count_queries() as counter:
+            ...
+        counter.count
+    """
+    counter = QueryCounter()
+    event.listen(Engine, 'before_cursor_execute', counter._before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(Engine, 'before_cursor_execute', counter._before_cursor_execute)
+
+
+@contextmanager
+def assert_profile_queries(name):
+    """
+    断言上下文中按加载方案查询并访问关联对象时执行的SQL语句数量不超过方案的预期，用于单元测试
+    用法：
+        with assert_profile_queries('feed_card'):
+            articles = apply_profile(Article.query, 'feed_card').limit(10).all()
+            [article.user.name for article in articles]
+    """
+    profile = PROFILES[name]
+    with count_queries() as counter:
+        yield counter
+    assert counter.count <= profile.queries, 'Profile {} expected at most {} queries, executed {}:\n{}'.format(
+        name, profile.queries, counter.count, '\n'.join(counter.statements))
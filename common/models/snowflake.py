@@ -0,0 +1,9 @@
+from flask import current_app
+
+
+def generate_id():
+    """
+    生成snowflake id，用作分片表等需要全局唯一主键的字段默认值
+    :return: int
+    """
+    return current_app.id_worker.get_id()
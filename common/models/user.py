@@ -1,6 +1,7 @@
 from datetime import datetime
 
 from . import db
+from .snowflake import generate_id
 
 
 class LegalizeLog(db.Model):
@@ -120,6 +121,7 @@ class Relation(db.Model):
     """
     用户关系表
     """
+    __shard_key__ = 'user_id'  # 按用户id分片
     __tablename__ = 'user_relation'
 
     class RELATION:
@@ -127,7 +129,7 @@ class Relation(db.Model):
         FOLLOW = 1
         BLACKLIST = 2
 
-    id = db.Column('relation_id', db.Integer, primary_key=True, doc='主键ID')
+    id = db.Column('relation_id', db.Integer, primary_key=True, default=generate_id, doc='主键ID，snowflake生成，跨分片唯一')
     user_id = db.Column(db.Integer, db.ForeignKey('user_basic.user_id'), db.ForeignKey('user_profile.user_id'), doc='用户ID')
     target_user_id = db.Column(db.Integer, db.ForeignKey('user_basic.user_id'), doc='目标用户ID')
     relation = db.Column(db.Integer, doc='关系')
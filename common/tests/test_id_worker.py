@@ -0,0 +1,87 @@
+import time
+import unittest
+
+from utils.snowflake.exceptions import InvalidSystemClock
+from utils.snowflake.id_worker import IdWorker, TIMESTAMP_LEFT_SHIFT, TWEPOCH
+
+
+class FakeLease(object):
+    """
+    不访问redis的机器ID租约
+    """
+    def __init__(self, worker_id=1, min_timestamp=-1):
+        self.worker_id = worker_id
+        self.min_timestamp = min_timestamp
+        self.generation = 0
+        self.clock = None
+
+    def acquire(self):
+        self.generation += 1
+        return self.worker_id
+
+    def ensure(self):
+        return self.worker_id
+
+    def handoff(self, min_timestamp):
+        """
+        模拟重新租用，上一个持有者的时间戳为min_timestamp
+        """
+        self.min_timestamp = min_timestamp
+        self.generation += 1
+
+
+def id_timestamp(_id):
+    return (_id >> TIMESTAMP_LEFT_SHIFT) + TWEPOCH
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class LeaseHandoffTestCase(unittest.TestCase):
+    """
+    接手机器ID租约
+    """
+    def test_previous_holder_clock_ahead(self):
+        # 上一个持有者的时钟领先50ms，超过容忍的回拨，但在等待时间之内
+        lease = FakeLease(min_timestamp=now_ms() + 50)
+        worker = IdWorker(0, None, lease=lease, max_rollback=10, max_handoff_wait=1000)
+
+        _id = worker.get_id()
+        self.assertGreater(id_timestamp(_id), lease.min_timestamp)
+        self.assertEqual(worker.stats['rollbacks'], 0)
+
+        ids = worker.get_ids(5000)
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertGreater(ids[0], _id)
+
+    def test_previous_holder_clock_far_ahead(self):
+        lease = FakeLease(min_timestamp=now_ms() + 60 * 1000)
+        worker = IdWorker(0, None, lease=lease, max_handoff_wait=1000)
+
+        self.assertRaises(InvalidSystemClock, worker.get_id)
+        # 时钟偏差消失（如租约换成其他机器ID）后恢复
+        lease.handoff(now_ms() - 1000)
+        self.assertGreater(worker.get_id(), 0)
+
+    def test_reacquire_after_issuing(self):
+        lease = FakeLease()
+        worker = IdWorker(0, None, lease=lease)
+        first = worker.get_id()
+
+        lease.handoff(now_ms() + 20)
+        second = worker.get_id()
+        self.assertGreater(second, first)
+        self.assertGreater(id_timestamp(second), lease.min_timestamp)
+
+    def test_previous_holder_clock_behind(self):
+        lease = FakeLease(min_timestamp=now_ms() - 60 * 1000)
+        worker = IdWorker(0, None, lease=lease)
+
+        begin = time.monotonic()
+        worker.get_id()
+        self.assertLess(time.monotonic() - begin, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
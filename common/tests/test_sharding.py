@@ -0,0 +1,38 @@
+import unittest
+from collections import Counter
+
+from models.db_routing.sharding import ShardMap
+from utils.snowflake.id_worker import IdWorker
+
+
+class ShardForTestCase(unittest.TestCase):
+    """
+    分片路由
+    """
+    def _shard_map(self, n):
+        return ShardMap([{'masters': ['m{}'.format(i)]} for i in range(n)])
+
+    def test_snowflake_ids_spread(self):
+        # 同一毫秒内批量生成与逐个生成的雪花id，低位大多相同
+        worker = IdWorker(0, 1)
+        ids = worker.get_ids(2000) + [worker.get_id() for _ in range(2000)]
+
+        for n in (2, 3, 4, 8, 16):
+            shard_map = self._shard_map(n)
+            counts = Counter(shard_map.shard_for(user_id) for user_id in ids)
+            self.assertEqual(len(counts), n)
+            expected = len(ids) / n
+            for shard_id, count in counts.items():
+                self.assertGreater(count, expected * 0.8, 'shard {} of {}'.format(shard_id, n))
+                self.assertLess(count, expected * 1.2, 'shard {} of {}'.format(shard_id, n))
+
+    def test_stable(self):
+        # 分片结果决定数据所在的库，不能随版本变化
+        shard_map = self._shard_map(8)
+        self.assertEqual(shard_map.shard_for(1), 7)
+        self.assertEqual(shard_map.shard_for(1155989075455377414), 6)
+        self.assertEqual(shard_map.shard_for('1155989075455377414'), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
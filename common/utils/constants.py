@@ -1,2 +1,5 @@
 # 配置文件环境变量名
 GLOBAL_SETTING_ENV_NAME = 'TOUTIAO_WEB_SETTINGS'
+
+# 每个进程缓存的已验证token数量
+VERIFIED_TOKEN_CACHE_SIZE = 10000
@@ -18,6 +18,19 @@ def set_db_to_read(func):
     return wrapper
 
 
+def login_required(func):
+    """
+    用户必须登录装饰器
+    使用refresh_token时同样视为未登录
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not g.user_id or g.is_refresh:
+            return {'message': 'User must be authorized.'}, 401
+        return func(*args, **kwargs)
+    return wrapper
+
+
 def set_db_to_write(func):
     """
     设置使用写数据库
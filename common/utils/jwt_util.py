@@ -1,3 +1,7 @@
+import time
+import threading
+from collections import OrderedDict
+
 import jwt
 from flask import current_app
 
@@ -31,8 +35,58 @@ def verify_jwt(token, secret=None):
         secret = current_app.config['JWT_SECRET']
 
     try:
-        payload = jwt.decode(token, secret, algorithm=['HS256'])
+        payload = jwt.decode(token, secret, algorithms=['HS256'])
     except jwt.PyJWTError:
         payload = None
 
     return payload
+
+
+class VerifiedTokenCache(object):
+    """
+    已验证token的进程内LRU缓存
+    同一token的重复请求直接使用缓存的载荷，不再进行HMAC校验与JSON解析，缓存到token过期为止。
+    以完整token为键而不是只用签名部分，避免签名相同、载荷被篡改的token命中缓存
+    """
+    def __init__(self, maxsize):
+        """
+        初始化
+        :param maxsize: 最大数量，为0时不缓存
+        """
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        """
+        获取已验证token的载荷
+        :param token: jwt
+        :return: dict 载荷，未缓存或已过期时返回None
+        """
+        with self._lock:
+            payload = self._data.get(token)
+            if payload is None:
+                return None
+            if payload['exp'] <= time.time():
+                del self._data[token]
+                return None
+            self._data.move_to_end(token)
+            return payload
+
+    def put(self, token, payload):
+        """
+        缓存已验证token的载荷
+        :param token: jwt
+        :param payload: dict 载荷，需包含exp
+        """
+        if self.maxsize <= 0 or 'exp' not in payload:
+            return
+        with self._lock:
+            self._data[token] = payload
+            self._data.move_to_end(token)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,60 @@
+from flask import request, g
+
+from cache.token import token_revocation_list
+from .jwt_util import verify_jwt, VerifiedTokenCache
+from . import constants
+
+
+verified_token_cache = VerifiedTokenCache(constants.VERIFIED_TOKEN_CACHE_SIZE)
+
+
+def jwt_authentication():
+    """
+    根据jwt验证用户身份
+    设置 g.user_id 用户id，未认证时为None；g.is_refresh 是否为refresh_token；g.token_id token id
+    """
+    g.user_id = None
+    g.is_refresh = False
+    g.token_id = None
+
+    authorization = request.headers.get('Authorization')
+    if not authorization or not authorization.startswith('Bearer '):
+        return
+    token = authorization[7:]
+
+    payload = verified_token_cache.get(token)
+    if payload is None:
+        payload = verify_jwt(token)
+        if payload is None:
+            return
+        verified_token_cache.put(token, payload)
+
+    # 已撤销的token缓存期间仍需检查，未撤销时只检查本地布隆过滤器镜像
+    if token_revocation_list.is_revoked(payload):
+        return
+
+    g.user_id = payload.get('user_id')
+    g.is_refresh = payload.get('refresh', False)
+    g.token_id = payload.get('tid')
+
+
+if __name__ == '__main__':
+    # 每个请求的认证开销，对比使用与不使用已验证token缓存
+    # 在common目录下执行 python -m utils.middlewares
+    import timeit
+    from datetime import datetime, timedelta
+    from flask import Flask
+    from .jwt_util import generate_jwt
+
+    app = Flask(__name__)
+    app.config['JWT_SECRET'] = 'benchmark'
+    token = generate_jwt({'user_id': 1, 'refresh': False}, datetime.utcnow() + timedelta(hours=2), 'benchmark')
+
+    number = 100000
+    with app.test_request_context(headers={'Authorization': 'Bearer ' + token}):
+        for maxsize in (0, constants.VERIFIED_TOKEN_CACHE_SIZE):
+            verified_token_cache.maxsize = maxsize
+            verified_token_cache.clear()
+            cost = timeit.timeit(jwt_authentication, number=number)
+            assert g.user_id == 1
+            print('cache={} {:.2f}us/request'.format('on' if maxsize else 'off', cost / number * 1e6))
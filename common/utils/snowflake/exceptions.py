@@ -3,3 +3,10 @@ class InvalidSystemClock(Exception):
     时钟回拨异常
     """
     pass
+
+
+class WorkerIdUnavailable(Exception):
+    """
+    没有可用的机器ID，或机器ID租约已失效
+    """
+    pass
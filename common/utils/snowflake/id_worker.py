@@ -3,6 +3,7 @@
 
 import time
 import logging
+import threading
 
 from .exceptions import InvalidSystemClock
 
@@ -27,6 +28,19 @@ SEQUENCE_MASK = -1 ^ (-1 << SEQUENCE_BITS)
 # Twitter元年时间戳
 TWEPOCH = 1288834974657
 
+# 时钟来源
+CLOCK_MONOTONIC = 'monotonic'  # 启动时以系统时间为基准，之后按单调时钟计时，不受系统时间回拨影响
+CLOCK_WALL = 'wall'  # 系统时间
+
+# 时钟回拨不超过此值时休眠等待时钟追上，超过时借用上次时间戳剩余的序号, 毫秒
+CLOCK_ROLLBACK_SLEEP = 2
+
+# 单调时钟与系统时间重新校准的间隔, 秒
+CLOCK_RESYNC_INTERVAL = 1
+
+# 系统时间落后时单调时钟每次校准最多回调的量, 毫秒，逐步回调而不产生时钟回拨
+CLOCK_SLEW_STEP = 1
+
 
 logger = logging.getLogger('flask.app')
 
@@ -36,15 +50,39 @@ class IdWorker(object):
     用于生成IDs
     """
 
-    def __init__(self, datacenter_id, worker_id, sequence=0):
+    def __init__(self, datacenter_id, worker_id, sequence=0, lease=None, clock=CLOCK_MONOTONIC, max_rollback=10,
+                 max_handoff_wait=1000):
         """
         初始化
         :param datacenter_id: 数据中心（机器区域）ID
-        :param worker_id: 机器ID
+        :param worker_id: 机器ID，使用lease时忽略
         :param sequence: 其实序号
+        :param lease: WorkerIdLease 从redis租用机器ID，多进程部署时保证每个进程的机器ID不同
+        :param clock: 时钟来源 CLOCK_MONOTONIC 或 CLOCK_WALL
+        :param max_rollback: 容忍的时钟回拨, 毫秒，超过时抛出InvalidSystemClock，为0时不容忍
+        :param max_handoff_wait: 接手租约时等待上一个持有者的时间戳的最长时间, 毫秒，超过时抛出InvalidSystemClock
         """
+        if clock not in (CLOCK_MONOTONIC, CLOCK_WALL):
+            raise ValueError('clock值无效')
+        self.clock = clock
+        self.max_rollback = max_rollback
+        self.max_handoff_wait = max_handoff_wait
+        # 单调时钟与系统时间的差值, 毫秒，定期按系统时间校准
+        self._clock_offset = time.time() * 1000 - time.monotonic() * 1000
+        self._last_resync = time.monotonic()
+
+        self.last_timestamp = -1  # 上次计算的时间戳
+        self._lock = threading.Lock()
+
+        self.lease = lease
+        self._lease_generation = None
+        if lease is not None:
+            # 租约记录本进程可能生成的最大时间戳，供接手该机器ID的进程使用
+            lease.clock = self._gen_timestamp
+            worker_id = lease.acquire()
+
         # sanity check
-        if worker_id > MAX_WORKER_ID or worker_id < 0:
+        if worker_id is None or worker_id > MAX_WORKER_ID or worker_id < 0:
             raise ValueError('worker_id值越界')
 
         if datacenter_id > MAX_DATACENTER_ID or datacenter_id < 0:
@@ -54,48 +92,179 @@ class IdWorker(object):
         self.datacenter_id = datacenter_id
         self.sequence = sequence
 
-        self.last_timestamp = -1  # 上次计算的时间戳
+        # 计数
+        self.wrap_count = 0  # 一毫秒内序号用完，等待下一毫秒的次数
+        self.rollback_count = 0  # 检测到时钟回拨的次数
+        self.borrow_count = 0  # 时钟回拨时借用序号的次数
+
+    @property
+    def stats(self):
+        """
+        序号用完与时钟回拨的计数
+        :return: dict
+        """
+        return {
+            'wraps': self.wrap_count,
+            'rollbacks': self.rollback_count,
+            'borrows': self.borrow_count,
+        }
+
+    def _now(self):
+        """
+        当前时间
+        :return: float 毫秒时间戳
+        """
+        if self.clock == CLOCK_MONOTONIC:
+            return self._clock_offset + time.monotonic() * 1000
+        return time.time() * 1000
 
     def _gen_timestamp(self):
         """
         生成整数时间戳
         :return:int timestamp
         """
-        return int(time.time() * 1000)
+        return int(self._now())
 
     def get_id(self):
         """
         获取新ID
         :return:
         """
+        with self._lock:
+            timestamp, sequence, _ = self._reserve(1)
+            return self._make_id(timestamp, sequence)
+
+    def get_ids(self, n):
+        """
+        批量获取新ID，用于批量插入与数据迁移
+        一次加锁预留连续的序号，一毫秒内的序号用完后继续使用下一毫秒
+        :param n: 数量
+        :return: list 递增的ID
+        """
+        ids = []
+        with self._lock:
+            while len(ids) < n:
+                timestamp, sequence, count = self._reserve(n - len(ids))
+                ids.extend(self._make_id(timestamp, sequence + i) for i in range(count))
+        return ids
+
+    def _reserve(self, count):
+        """
+        预留同一毫秒内的一段序号，调用时需持有锁
+        :param count: 需要的数量
+        :return: (timestamp, 起始序号, 实际预留的数量)，当前毫秒剩余的序号不足时少于count
+        """
+        if self.lease is not None:
+            self._ensure_lease()
+
+        if self.clock == CLOCK_MONOTONIC:
+            self._resync()
         timestamp = self._gen_timestamp()
 
         # 时钟回拨
         if timestamp < self.last_timestamp:
-            logging.error('clock is moving backwards. Rejecting requests until {}'.format(self.last_timestamp))
-            raise InvalidSystemClock
+            timestamp = self._handle_rollback(timestamp)
 
         if timestamp == self.last_timestamp:
-            self.sequence = (self.sequence + 1) & SEQUENCE_MASK
-            if self.sequence == 0:
+            sequence = (self.sequence + 1) & SEQUENCE_MASK
+            if sequence == 0:
                 timestamp = self._til_next_millis(self.last_timestamp)
         else:
-            self.sequence = 0
+            sequence = 0
 
+        count = min(count, SEQUENCE_MASK + 1 - sequence)
+        self.sequence = sequence + count - 1
         self.last_timestamp = timestamp
+        return timestamp, sequence, count
+
+    def _ensure_lease(self):
+        """
+        检查租约，重新租用后等到上一个持有者可能生成的最大时间戳之后再生成ID，调用时需持有锁
+        该时间戳来自其他机器的时钟，领先本机时是时钟偏差而不是回拨，不按时钟回拨处理
+        """
+        self.worker_id = self.lease.ensure()
+        if self._lease_generation == self.lease.generation:
+            return
+
+        min_timestamp = self.lease.min_timestamp
+        wait = min_timestamp + 1 - self._now()
+        if wait > self.max_handoff_wait:
+            logger.error('worker id {}-{} was used until {}, {:.0f}ms ahead. Rejecting requests'.format(
+                self.datacenter_id, self.worker_id, min_timestamp, wait))
+            raise InvalidSystemClock
+        if wait > 0:
+            logger.warning('worker id {}-{} was used until {}, waiting {:.0f}ms'.format(
+                self.datacenter_id, self.worker_id, min_timestamp, wait))
+            self._wait_until(min_timestamp + 1)
+        if min_timestamp >= self.last_timestamp:
+            # 序号置满，之后的时间戳不早于min_timestamp，且同一毫秒内不再生成ID
+            self.last_timestamp = min_timestamp
+            self.sequence = SEQUENCE_MASK
+        self._lease_generation = self.lease.generation
+
+    def _resync(self):
+        """
+        按系统时间校准单调时钟，调用时需持有锁
+        系统时间领先时直接跟上；落后时每次最多回调CLOCK_SLEW_STEP，且不早于上次的时间戳，
+        避免长期运行的进程与系统时间偏差越来越大
+        """
+        monotonic = time.monotonic()
+        if monotonic - self._last_resync < CLOCK_RESYNC_INTERVAL:
+            return
+        self._last_resync = monotonic
+
+        offset = time.time() * 1000 - monotonic * 1000
+        if offset >= self._clock_offset:
+            self._clock_offset = offset
+        else:
+            offset = max(offset, self._clock_offset - CLOCK_SLEW_STEP)
+            floor = self.last_timestamp - monotonic * 1000
+            self._clock_offset = max(offset, min(floor, self._clock_offset))
 
-        new_id = ((timestamp - TWEPOCH) << TIMESTAMP_LEFT_SHIFT) | (self.datacenter_id << DATACENTER_ID_SHIFT) | \
-                 (self.worker_id << WOKER_ID_SHIFT) | self.sequence
-        return new_id
+    def _make_id(self, timestamp, sequence):
+        return ((timestamp - TWEPOCH) << TIMESTAMP_LEFT_SHIFT) | (self.datacenter_id << DATACENTER_ID_SHIFT) | \
+               (self.worker_id << WOKER_ID_SHIFT) | sequence
+
+    def _handle_rollback(self, timestamp):
+        """
+        处理时钟回拨
+        回拨较小时休眠到时钟追上上次的时间戳；较大时继续使用上次的时间戳，借用其剩余的序号，
+        序号用完时等待时钟追上。生成的ID不会与已生成的重复，且保持递增
+        :param timestamp: 回拨后的时间戳
+        :return: 使用的时间戳
+        """
+        rollback = self.last_timestamp - timestamp
+        self.rollback_count += 1
+        if rollback > self.max_rollback:
+            logger.error('clock is moving backwards {}ms. Rejecting requests until {}'.format(
+                rollback, self.last_timestamp))
+            raise InvalidSystemClock
+
+        logger.warning('clock is moving backwards {}ms'.format(rollback))
+        if rollback <= CLOCK_ROLLBACK_SLEEP:
+            return self._wait_until(self.last_timestamp)
+
+        self.borrow_count += 1
+        return self.last_timestamp
 
     def _til_next_millis(self, last_timestamp):
         """
         等到下一毫秒
         """
-        timestamp = self._gen_timestamp()
-        while timestamp <= last_timestamp:
-            timestamp = self._gen_timestamp()
-        return timestamp
+        self.wrap_count += 1
+        return self._wait_until(last_timestamp + 1)
+
+    def _wait_until(self, timestamp):
+        """
+        休眠到指定时间戳，而不是循环读取时钟占用CPU
+        :param timestamp: 毫秒时间戳
+        :return: int 当前时间戳，不小于timestamp
+        """
+        now = self._now()
+        while now < timestamp:
+            time.sleep((timestamp - now) / 1000)
+            now = self._now()
+        return int(now)
 
 
 if __name__ == '__main__':
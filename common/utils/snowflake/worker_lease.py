@@ -0,0 +1,162 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+
+from .exceptions import WorkerIdUnavailable
+
+
+# 机器ID租约有效期, 毫秒
+LEASE_TTL = 30 * 1000
+
+# 续约间隔, 秒
+HEARTBEAT_INTERVAL = 10
+
+# 租约到期前停止生成ID的安全时间, 秒，覆盖网络延迟与进程暂停
+LEASE_SAFETY_MARGIN = 5
+
+# 机器ID已生成的最大时间戳记录的有效期, 毫秒，需远大于租约有效期
+ISSUED_TTL = 24 * 60 * 60 * 1000
+
+
+logger = logging.getLogger('flask.app')
+
+
+class WorkerIdLease(object):
+    """
+    从redis租用机器ID
+    同一数据中心的每个进程租用不同的机器ID，后台线程定期续约，
+    租约可能已失效（续约失败超过有效期）时停止生成ID，避免与接手该机器ID的进程生成重复的ID
+    """
+    # 仅当租约属于自己时续约，同时记录本租约内可能生成的最大时间戳
+    RENEW_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        redis.call('set', KEYS[2], ARGV[3], 'px', ARGV[4])
+        return redis.call('pexpire', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+
+    def __init__(self, redis, datacenter_id, max_worker_id):
+        """
+        初始化
+        :param redis: redis客户端
+        :param datacenter_id: 数据中心ID
+        :param max_worker_id: 最大机器ID
+        """
+        self.redis = redis
+        self.datacenter_id = datacenter_id
+        self.max_worker_id = max_worker_id
+        self._renew = redis.register_script(self.RENEW_SCRIPT)
+
+        self.worker_id = None
+        self._owner = None
+        self._pid = None
+        self._valid_until = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+        # 生成ID的时钟，毫秒时间戳，由IdWorker设置
+        self.clock = lambda: int(time.time() * 1000)
+        # 上一个持有者可能生成的最大时间戳，之后生成的ID须大于此值
+        self.min_timestamp = -1
+        # 每次租用加1，IdWorker据此发现重新租用
+        self.generation = 0
+
+    def _key(self, worker_id):
+        return 'snowflake:{}:worker:{}'.format(self.datacenter_id, worker_id)
+
+    def _issued_key(self, worker_id):
+        return 'snowflake:{}:worker:{}:issued'.format(self.datacenter_id, worker_id)
+
+    def _issued_bound(self):
+        """
+        本租约内可能生成的最大时间戳
+        """
+        return self.clock() + LEASE_TTL
+
+    def acquire(self):
+        """
+        租用一个空闲的机器ID，并启动续约线程
+        :return: 机器ID
+        """
+        with self._lock:
+            self._acquire()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._heartbeat, name='snowflake-lease', daemon=True)
+            self._thread.start()
+        return self.worker_id
+
+    def _acquire(self):
+        self._pid = os.getpid()
+        self._owner = '{}:{}:{}'.format(socket.gethostname(), self._pid, uuid.uuid4().hex)
+
+        # 优先租用上次的机器ID
+        candidates = list(range(self.max_worker_id + 1))
+        if self.worker_id is not None:
+            candidates.remove(self.worker_id)
+            candidates.insert(0, self.worker_id)
+
+        for worker_id in candidates:
+            start = time.monotonic()
+            if self.redis.set(self._key(worker_id), self._owner, px=LEASE_TTL, nx=True):
+                issued = self.redis.get(self._issued_key(worker_id))
+                self.redis.set(self._issued_key(worker_id), self._issued_bound(), px=ISSUED_TTL)
+                self.worker_id = worker_id
+                self.min_timestamp = int(issued) if issued else -1
+                self.generation += 1
+                self._valid_until = start + LEASE_TTL / 1000 - LEASE_SAFETY_MARGIN
+                logger.info('[IdWorker] leased worker id {}-{}'.format(self.datacenter_id, worker_id))
+                return
+        raise WorkerIdUnavailable('No free worker id in datacenter {}.'.format(self.datacenter_id))
+
+    def ensure(self):
+        """
+        检查租约，生成ID前调用
+        fork后的子进程重新租用；租约可能已失效时抛出异常
+        :return: 机器ID
+        """
+        if self._pid != os.getpid():
+            # fork后后台线程不存在，且不能与父进程使用同一机器ID
+            self._thread = None
+            self.worker_id = None
+            return self.acquire()
+        if time.monotonic() >= self._valid_until:
+            raise WorkerIdUnavailable('Worker id lease {}-{} may have expired.'.format(
+                self.datacenter_id, self.worker_id))
+        return self.worker_id
+
+    def _heartbeat(self):
+        """
+        定期续约，租约已被其他进程占用时重新租用
+        """
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            if self._pid != os.getpid():
+                return
+            start = time.monotonic()
+            try:
+                with self._lock:
+                    keys = [self._key(self.worker_id), self._issued_key(self.worker_id)]
+                    args = [self._owner, LEASE_TTL, self._issued_bound(), ISSUED_TTL]
+                    if self._renew(keys=keys, args=args):
+                        self._valid_until = start + LEASE_TTL / 1000 - LEASE_SAFETY_MARGIN
+                    else:
+                        logger.warning('[IdWorker] lost worker id lease {}-{}'.format(
+                            self.datacenter_id, self.worker_id))
+                        self._acquire()
+            except Exception as e:
+                logger.error('[IdWorker] renew worker id lease failed: {}'.format(e))
+
+    def release(self):
+        """
+        释放租约
+        """
+        with self._lock:
+            if self.worker_id is None:
+                return
+            if self.redis.get(self._key(self.worker_id)) == self._owner.encode():
+                self.redis.delete(self._key(self.worker_id))
+            self._valid_until = 0
@@ -0,0 +1,117 @@
+"""
+缓存序列化性能对比，使用线上缓存中的真实文章、公告数据
+
+1. 在可访问redis集群的环境中，从已有的缓存导出样本（只读，不访问数据库）
+    python scripts/bench_cache_serializer.py capture /tmp/cache_fixtures.json --limit 1000
+2. 对比各序列化方式的大小与耗时
+    python scripts/bench_cache_serializer.py bench /tmp/cache_fixtures.json
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'common'))
+
+from cache.article import ArticleDetailCache
+from cache.announcement import AnnouncementDetailCache
+from cache.serializer import PickleSerializer, JSONSerializer
+
+
+# 样本名称: (缓存类, 缓存键匹配模式)
+CACHES = {
+    'article': (ArticleDetailCache, 'art:*:detail'),
+    'announcement': (AnnouncementDetailCache, 'announce:*'),
+}
+
+
+def capture(path, limit):
+    """
+    从redis集群导出缓存的记录
+    :param path: 样本文件路径
+    :param limit: 每种缓存最多导出的数量
+    """
+    from rediscluster import StrictRedisCluster
+    from toutiao import create_flask_app
+    from settings.default import DefaultConfig
+
+    app = create_flask_app(DefaultConfig, enable_config_file=True)
+    r = StrictRedisCluster(startup_nodes=app.config['REDIS_CLUSTER'])
+
+    fixtures = {}
+    for name, (cache_class, pattern) in CACHES.items():
+        records = []
+        for key in r.scan_iter(match=pattern, count=1000):
+            data = r.get(key)
+            # 不存在的数据、旧格式或其他类型的键
+            if not data or data == cache_class.NOT_EXISTS:
+                continue
+            record = cache_class.serializer.loads(data)
+            if record is not None:
+                records.append(record)
+            if len(records) >= limit:
+                break
+        fixtures[name] = records
+        print('{}: {} records'.format(name, len(records)))
+
+    with open(path, 'w') as f:
+        json.dump(fixtures, f, ensure_ascii=False)
+
+
+def bench(path, number):
+    """
+    对比pickle、json与缓存类使用的序列化方式
+    :param path: 样本文件路径
+    :param number: 每条记录的重复次数
+    """
+    with open(path) as f:
+        fixtures = json.load(f)
+
+    for name, records in fixtures.items():
+        if not records:
+            continue
+        cache_class, _ = CACHES[name]
+        serializers = {
+            'pickle': PickleSerializer(),
+            'json': JSONSerializer(),
+            'compact': cache_class.serializer,
+        }
+
+        print('{} ({} records)'.format(name, len(records)))
+        for serializer_name, serializer in serializers.items():
+            datas = [serializer.dumps(record) for record in records]
+            for record, data in zip(records, datas):
+                assert serializer.loads(data) == record
+
+            sizes = sorted(len(data) for data in datas)
+            dumps_cost = timeit.timeit(lambda: [serializer.dumps(record) for record in records], number=number)
+            loads_cost = timeit.timeit(lambda: [serializer.loads(data) for data in datas], number=number)
+            count = len(records) * number
+            print('  {:<8} bytes mean={:<7.0f} p50={:<7} p95={:<7} dumps={:.2f}us loads={:.2f}us'.format(
+                serializer_name, sum(sizes) / len(sizes), sizes[len(sizes) // 2],
+                sizes[min(len(sizes) - 1, len(sizes) * 95 // 100)],
+                dumps_cost / count * 1e6, loads_cost / count * 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='缓存序列化性能对比')
+    subparsers = parser.add_subparsers(dest='command')
+
+    capture_parser = subparsers.add_parser('capture', help='从redis集群导出缓存的记录')
+    capture_parser.add_argument('path')
+    capture_parser.add_argument('--limit', type=int, default=1000, help='每种缓存最多导出的数量')
+
+    bench_parser = subparsers.add_parser('bench', help='对比序列化方式')
+    bench_parser.add_argument('path')
+    bench_parser.add_argument('--number', type=int, default=100, help='每条记录的重复次数')
+
+    args = parser.parse_args()
+    if args.command == 'capture':
+        capture(args.path, args.limit)
+    elif args.command == 'bench':
+        bench(args.path, args.number)
+    else:
+        parser.print_help()
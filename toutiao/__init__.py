@@ -1,3 +1,4 @@
+from datetime import datetime
 from flask import Flask
 from redis.exceptions import RedisError
 from sqlalchemy.exc import SQLAlchemyError
@@ -31,12 +32,6 @@ def create_app(config, enable_config_file=False):
     """
     app = create_flask_app(config, enable_config_file)
 
-    # 创建Snowflake ID worker
-    from utils.snowflake.id_worker import IdWorker
-    app.id_worker = IdWorker(app.config['DATACENTER_ID'],
-                             app.config['WORKER_ID'],
-                             app.config['SEQUENCE'])
-
     # 限流器
     from utils.limiter import limiter as lmt
     lmt.init_app(app)
@@ -57,6 +52,24 @@ def create_app(config, enable_config_file=False):
     from rediscluster import StrictRedisCluster
     app.redis_cluster = StrictRedisCluster(startup_nodes=app.config['REDIS_CLUSTER'])
 
+    # 创建Snowflake ID worker，未配置WORKER_ID时从redis租用机器ID
+    from utils.snowflake.id_worker import IdWorker, MAX_WORKER_ID
+    from utils.snowflake.worker_lease import WorkerIdLease
+    lease = None
+    if app.config['WORKER_ID'] is None:
+        lease = WorkerIdLease(app.redis_master, app.config['DATACENTER_ID'], MAX_WORKER_ID)
+    app.id_worker = IdWorker(app.config['DATACENTER_ID'],
+                             app.config['WORKER_ID'],
+                             app.config['SEQUENCE'],
+                             lease=lease,
+                             clock=app.config['SNOWFLAKE_CLOCK'],
+                             max_rollback=app.config['SNOWFLAKE_MAX_ROLLBACK'],
+                             max_handoff_wait=app.config['SNOWFLAKE_MAX_HANDOFF_WAIT'])
+
+    # 进程内缓存失效通知
+    from cache.invalidation import invalidation_bus
+    invalidation_bus.init_app(app)
+
     # rpc
     # app.rpc_reco = grpc.insecure_channel(app.config['RPC'].RECOMMEND)
 
@@ -77,11 +90,48 @@ def create_app(config, enable_config_file=False):
     # MySQL数据库连接初始化
     from models import db
 
+    # 数据库查询指标，需在数据库初始化前读取配置
+    from models.db_routing.metrics import query_metrics
+    query_metrics.init_app(app)
+    if query_metrics.enabled:
+        app.add_url_rule('/metrics/db', 'db_metrics', query_metrics.view)
+
     db.init_app(app)
 
-    # # 添加请求钩子
-    # from utils.middlewares import jwt_authentication
-    # app.before_request(jwt_authentication)
+    # 创建APScheduler定时任务调度器对象
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.executors.pool import ThreadPoolExecutor
+    executors = {
+        'default': ThreadPoolExecutor(10)
+    }
+    app.scheduler = BackgroundScheduler(executors=executors)
+
+    # 每天凌晨3点修正统计数据
+    from .schedulers.statistic import fix_statistics
+    app.scheduler.add_job(fix_statistics, 'cron', hour=3, args=[app])
+
+    # 每分钟持久化阅读历史
+    from .schedulers.reading import persist_reading_histories
+    app.scheduler.add_job(persist_reading_histories, 'interval', minutes=1, args=[app])
+
+    # 每2秒批量持久化点赞、收藏等用户操作
+    from .schedulers.interaction import persist_interactions
+    app.scheduler.add_job(persist_interactions, 'interval', seconds=2, args=[app])
+
+    # 每天凌晨4点重建布隆过滤器，每个进程启动时及每10分钟同步本地镜像
+    from .schedulers.bloom import rebuild_bloom_filters, sync_bloom_filters
+    app.scheduler.add_job(rebuild_bloom_filters, 'cron', hour=4, args=[app])
+    app.scheduler.add_job(sync_bloom_filters, 'interval', minutes=10, next_run_time=datetime.now(), args=[app])
+
+    # 每个进程启动时及每分钟同步已撤销token的本地镜像
+    from .schedulers.token import sync_token_revocations
+    app.scheduler.add_job(sync_token_revocations, 'interval', minutes=1, next_run_time=datetime.now(), args=[app])
+
+    app.scheduler.start()
+
+    # 添加请求钩子
+    from utils.middlewares import jwt_authentication
+    app.before_request(jwt_authentication)
 
     # 注册用户模块蓝图
     from .resources.user import user_bp
@@ -5,6 +5,9 @@ LIMIT_SMS_VERIFICATION_CODE_BY_MOBILE = '1/minute'
 # 根据IP限制短信验证码发送频次
 LIMIT_SMS_VERIFICATION_CODE_BY_IP = '100/hour'
 
+# 根据IP限制登录频次，避免同一IP对多个手机号尝试验证码
+LIMIT_AUTHORIZATION_BY_IP = '100/hour'
+
 # 短信验证码有效期, 秒
 SMS_VERIFICATION_CODE_EXPIRES = 5 * 60
 
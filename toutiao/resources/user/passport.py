@@ -4,7 +4,6 @@ from flask import request, current_app, g
 from flask_restful.reqparse import RequestParser
 import random
 from datetime import datetime, timedelta
-from redis.exceptions import ConnectionError
 
 from celery_tasks.sms.tasks import send_verification_code
 from . import constants
@@ -12,9 +11,13 @@ from utils import parser
 from models import db
 from models.user import User, UserProfile
 from utils.jwt_util import generate_jwt
+from cache.token import token_revocation_list
+from cache.sms import SMSVerificationCodeStorage
+from cache.user import UserMobileCache
 # from cache import user as cache_user
+from cache.bloom import user_bloom_filter
 from utils.limiter import limiter as lmt
-from utils.decorators import set_db_to_read, set_db_to_write
+from utils.decorators import set_db_to_read, login_required
 
 
 class SMSVerificationCodeResource(Resource):
@@ -34,7 +37,7 @@ class SMSVerificationCodeResource(Resource):
 
     def get(self, mobile):
         code = '{:0>6d}'.format(random.randint(0, 999999))
-        current_app.redis_master.setex('app:code:{}'.format(mobile), constants.SMS_VERIFICATION_CODE_EXPIRES, code)
+        SMSVerificationCodeStorage(mobile).save(code, constants.SMS_VERIFICATION_CODE_EXPIRES)
         send_verification_code.delay(mobile, code)
         return {'mobile': mobile}
 
@@ -43,19 +46,42 @@ class AuthorizationResource(Resource):
     """
     认证
     """
+    decorators = [
+        lmt.limit(constants.LIMIT_AUTHORIZATION_BY_IP,
+                  key_func=get_remote_address,
+                  methods=['POST'],
+                  error_message='Too many requests.')
+    ]
+
     method_decorators = {
-        'post': [set_db_to_write],
-        'put': [set_db_to_read]
+        'post': [set_db_to_read],
+        'put': [set_db_to_read],
+        'delete': [login_required]
     }
 
-    def _generate_tokens(self, user_id, with_refresh_token=True):
+    def _generate_tokens(self, user_id, with_refresh_token=True, token_id=None):
         """
         生成token 和refresh_token
         :param user_id: 用户id
+        :param with_refresh_token: 是否生成refresh_token
+        :param token_id: token id，一次登录颁发的token与refresh_token、及刷新的token共用，用于撤销，为None时生成新的id
         :return: token, refresh_token
         """
+        if token_id is None:
+            token_id = current_app.id_worker.get_id()
+
         # 颁发JWT
-        pass
+        now = datetime.utcnow()
+        payload = {'user_id': user_id, 'tid': token_id, 'iat': now}
+        expiry = now + timedelta(hours=current_app.config['JWT_EXPIRY_HOURS'])
+        token = generate_jwt(dict(payload, refresh=False), expiry)
+
+        refresh_token = None
+        if with_refresh_token:
+            refresh_expiry = now + timedelta(days=current_app.config['JWT_REFRESH_DAYS'])
+            refresh_token = generate_jwt(dict(payload, refresh=True), refresh_expiry)
+
+        return token, refresh_token
 
     def post(self):
         """
@@ -68,49 +94,57 @@ class AuthorizationResource(Resource):
         mobile = args.mobile
         code = args.code
 
-        # 从redis中获取验证码
-        key = 'app:code:{}'.format(mobile)
-        try:
-            real_code = current_app.redis_master.get(key)
-        except ConnectionError as e:
-            current_app.logger.error(e)
-            real_code = current_app.redis_slave.get(key)
-
-        try:
-            current_app.redis_master.delete(key)
-        except ConnectionError as e:
-            current_app.logger.error(e)
-
-        if not real_code or real_code.decode() != code:
+        # 校验并使用验证码
+        ret = SMSVerificationCodeStorage(mobile).verify(code)
+        if ret == SMSVerificationCodeStorage.LOCKED:
+            return {'message': 'Too many attempts.'}, 429
+        if ret != SMSVerificationCodeStorage.VERIFIED:
             return {'message': 'Invalid code.'}, 400
 
-        # 查询或保存用户
-        user = User.query.filter_by(mobile=mobile).first()
+        # 查询用户，缓存未命中时查询从库
+        mobile_cache = UserMobileCache(mobile)
+        user = mobile_cache.get()
 
         if user is None:
-            # 用户不存在，注册用户
-            user_id = current_app.id_worker.get_id()
-            user = User(id=user_id, mobile=mobile, name=mobile, last_login=datetime.now())
-            db.session.add(user)
-            profile = UserProfile(id=user.id)
-            db.session.add(profile)
-            db.session.commit()
-        else:
-            if user.status == User.STATUS.DISABLE:
-                return {'message': 'Invalid user.'}, 403
-
-        token, refresh_token = self._generate_tokens(user.id)
+            # 在主库确认，避免从库延迟或不存在的缓存未过期时重复注册
+            db.session().set_to_write()
+            user = User.query.filter_by(mobile=mobile).first()
+
+            if user is None:
+                # 用户不存在，注册用户
+                user_id = current_app.id_worker.get_id()
+                user = User(id=user_id, mobile=mobile, name=mobile, last_login=datetime.now())
+                db.session.add(user)
+                profile = UserProfile(id=user_id)
+                db.session.add(profile)
+                db.session.commit()
+                user_bloom_filter.add_many([user_id])
+                user = {'user_id': user_id, 'status': User.STATUS.ENABLE}
+            else:
+                user = {'user_id': user.id, 'status': user.status}
+
+            mobile_cache.save(user['user_id'], user['status'])
+
+        if user['status'] == User.STATUS.DISABLE:
+            return {'message': 'Invalid user.'}, 403
+
+        token, refresh_token = self._generate_tokens(user['user_id'])
 
         return {'token': token, 'refresh_token': refresh_token}, 201
 
+    def put(self):
+        """
+        使用refresh_token刷新token
+        """
+        if g.user_id is None or not g.is_refresh:
+            return {'message': 'Invalid refresh token.'}, 403
 
+        token, _ = self._generate_tokens(g.user_id, with_refresh_token=False, token_id=g.token_id)
+        return {'token': token}, 201
 
-
-
-
-
-
-
-
-
-
+    def delete(self):
+        """
+        退出登录，撤销本次登录颁发的token与refresh_token
+        """
+        token_revocation_list.revoke_token(g.token_id)
+        return {'message': 'OK'}
@@ -0,0 +1,34 @@
+from cache.bloom import ALL_BLOOM_FILTERS
+from models import db
+from . import constants
+
+
+def rebuild_bloom_filters(flask_app):
+    """
+    从数据库重建布隆过滤器
+    :param flask_app: Flask app对象
+    """
+    with flask_app.app_context():
+        # 每个进程都启动了定时任务，只由获得锁的进程执行
+        if not flask_app.redis_master.set(constants.REBUILD_BLOOM_FILTERS_LOCK_KEY, 1,
+                                          ex=constants.REBUILD_BLOOM_FILTERS_LOCK_EXPIRES, nx=True):
+            return
+
+        # 从库延迟期间新增的id不能遗漏，使用主库
+        db.session().set_to_write()
+        try:
+            for bloom_filter in ALL_BLOOM_FILTERS:
+                count = bloom_filter.rebuild()
+                flask_app.logger.info('[rebuild_bloom_filters] {} {}'.format(bloom_filter.key, count))
+        finally:
+            db.session.remove()
+
+
+def sync_bloom_filters(flask_app):
+    """
+    同步本进程的布隆过滤器镜像
+    :param flask_app: Flask app对象
+    """
+    with flask_app.app_context():
+        for bloom_filter in ALL_BLOOM_FILTERS:
+            bloom_filter.sync()
@@ -0,0 +1,11 @@
+# 修正统计数据定时任务锁，多个进程中只有获得锁的进程执行
+FIX_STATISTICS_LOCK_KEY = 'lock:schedule:fix_statistics'
+
+# 修正统计数据定时任务锁有效期, 秒
+FIX_STATISTICS_LOCK_EXPIRES = 60 * 60
+
+# 重建布隆过滤器定时任务锁
+REBUILD_BLOOM_FILTERS_LOCK_KEY = 'lock:schedule:rebuild_bloom_filters'
+
+# 重建布隆过滤器定时任务锁有效期, 秒
+REBUILD_BLOOM_FILTERS_LOCK_EXPIRES = 60 * 60
@@ -0,0 +1,97 @@
+from collections import defaultdict
+from sqlalchemy.exc import DatabaseError, OperationalError
+
+from cache import constants as cache_constants
+from cache.interaction import STORAGES, InteractionStream, merge_interactions
+from models import db
+
+
+_stream = None
+
+
+def persist_interactions(flask_app):
+    """
+    将redis流中的点赞、收藏等用户操作批量写入数据库
+    :param flask_app: Flask app对象
+    """
+    global _stream
+
+    with flask_app.app_context():
+        if _stream is None:
+            _stream = InteractionStream(flask_app.redis_master)
+
+        db.session().set_to_write()
+        try:
+            while True:
+                records = _stream.read(cache_constants.INTERACTION_PERSIST_BATCH_SIZE)
+                if not records:
+                    break
+
+                # 按用户所在分片分组，每个分片一个事务，失败的分片不确认，超时后重新处理
+                shards = defaultdict(list)
+                for record in records:
+                    shards[db.shard_map.shard_for(record[2]) if db.shard_map else None].append(record)
+
+                failed = False
+                for shard_id, shard_records in shards.items():
+                    try:
+                        _persist(shard_id, shard_records)
+                    except OperationalError as e:
+                        # 数据库不可用，不确认，超时后重新处理
+                        flask_app.logger.error(e)
+                        db.session.rollback()
+                        failed = True
+                        continue
+                    except DatabaseError as e:
+                        # 个别数据错误导致整批失败，逐个写入，确认成功的操作
+                        flask_app.logger.error(e)
+                        db.session.rollback()
+                        if not _persist_one_by_one(flask_app, shard_id, shard_records):
+                            failed = True
+                        continue
+                    _stream.ack([record[0] for record in shard_records])
+
+                if failed or len(records) < cache_constants.INTERACTION_PERSIST_BATCH_SIZE:
+                    break
+        finally:
+            db.session.remove()
+
+
+def _persist(shard_id, records):
+    """
+    在一个事务中写入一个分片的用户操作
+    :param shard_id: 分片id
+    :param records: list [(entry_id, kind, user_id, target_id, value, timestamp)]
+    """
+    for kind, rows in merge_interactions(records).items():
+        storage = STORAGES[kind]
+        db.session.execute(storage.upsert_statement(rows), mapper=storage.model, shard_id=shard_id)
+    db.session.commit()
+
+
+def _persist_one_by_one(flask_app, shard_id, records):
+    """
+    按用户与目标逐个写入，确认成功的操作，数据错误的操作移入死信流
+    :param flask_app: Flask app对象
+    :param shard_id: 分片id
+    :param records: list [(entry_id, kind, user_id, target_id, value, timestamp)]
+    :return: bool 数据库不可用时返回False，剩余的操作不确认
+    """
+    groups = defaultdict(list)
+    for record in records:
+        groups[record[1:4]].append(record)
+
+    for group in groups.values():
+        try:
+            _persist(shard_id, group)
+        except OperationalError as e:
+            flask_app.logger.error(e)
+            db.session.rollback()
+            return False
+        except DatabaseError as e:
+            flask_app.logger.error(e)
+            db.session.rollback()
+            _stream.dead_letter(group, str(e.orig) if e.orig is not None else str(e))
+            continue
+        _stream.ack([record[0] for record in group])
+    return True
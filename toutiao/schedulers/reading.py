@@ -0,0 +1,88 @@
+from datetime import datetime
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.exc import DatabaseError, OperationalError
+
+from cache import constants as cache_constants
+from cache.user import UserReadingHistoryStorage
+from models import db
+from models.news import Read
+
+
+def persist_reading_histories(flask_app):
+    """
+    将redis队列中的阅读记录批量写入数据库
+    :param flask_app: Flask app对象
+    """
+    with flask_app.app_context():
+        db.session().set_to_write()
+        try:
+            while True:
+                records = UserReadingHistoryStorage.pop_queue(cache_constants.READING_HISTORY_PERSIST_BATCH_SIZE)
+                if not records:
+                    break
+
+                try:
+                    _persist(records)
+                except OperationalError as e:
+                    # 数据库不可用，放回队列，下次重新处理
+                    flask_app.logger.error(e)
+                    db.session.rollback()
+                    UserReadingHistoryStorage.push_back_queue(records)
+                    break
+                except DatabaseError as e:
+                    # 个别数据错误导致整批失败，逐个写入
+                    flask_app.logger.error(e)
+                    db.session.rollback()
+                    if not _persist_one_by_one(flask_app, records):
+                        break
+
+                if len(records) < cache_constants.READING_HISTORY_PERSIST_BATCH_SIZE:
+                    break
+        finally:
+            db.session.remove()
+
+
+def _persist(records):
+    """
+    在一个事务中写入阅读记录
+    :param records: list [(user_id, article_id, timestamp)]
+    """
+    rows = []
+    for user_id, article_id, timestamp in records:
+        read_time = datetime.fromtimestamp(timestamp)
+        rows.append({
+            'user_id': user_id,
+            'article_id': article_id,
+            'create_time': read_time,
+            'update_time': read_time
+        })
+
+    stmt = insert(Read.__table__).values(rows)
+    # 队列不保证顺序，只前移阅读时间
+    stmt = stmt.on_duplicate_key_update(
+        update_time=func.greatest(Read.__table__.c.update_time, literal_column('VALUES(update_time)')))
+    db.session.execute(stmt)
+    db.session.commit()
+
+
+def _persist_one_by_one(flask_app, records):
+    """
+    逐个写入阅读记录，数据错误的记录移入死信队列
+    :param flask_app: Flask app对象
+    :param records: list [(user_id, article_id, timestamp)]
+    :return: bool 数据库不可用时返回False，剩余的记录放回队列
+    """
+    for i, record in enumerate(records):
+        try:
+            _persist([record])
+        except OperationalError as e:
+            flask_app.logger.error(e)
+            db.session.rollback()
+            UserReadingHistoryStorage.push_back_queue(records[i:])
+            return False
+        except DatabaseError as e:
+            flask_app.logger.error(e)
+            db.session.rollback()
+            UserReadingHistoryStorage.dead_letter([record], str(e.orig) if e.orig is not None else str(e))
+    return True
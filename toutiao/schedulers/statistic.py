@@ -0,0 +1,24 @@
+from cache import statistic
+from models import db
+from . import constants
+
+
+def fix_statistics(flask_app):
+    """
+    修正redis中的统计数据
+    :param flask_app: Flask app对象
+    """
+    with flask_app.app_context():
+        # 每个进程都启动了定时任务，只由获得锁的进程执行
+        if not flask_app.redis_master.set(constants.FIX_STATISTICS_LOCK_KEY, 1,
+                                          ex=constants.FIX_STATISTICS_LOCK_EXPIRES, nx=True):
+            return
+
+        # 统计值与数据库的比较需要读取最新数据，使用主库
+        db.session().set_to_write()
+        try:
+            for storage in statistic.RECONCILABLE_STORAGES:
+                repaired = storage.reconcile()
+                flask_app.logger.info('[fix_statistics] {} repaired {}'.format(storage.key, repaired))
+        finally:
+            db.session.remove()
@@ -0,0 +1,10 @@
+from cache.token import token_revocation_list
+
+
+def sync_token_revocations(flask_app):
+    """
+    同步本进程的已撤销token镜像
+    :param flask_app: Flask app对象
+    """
+    with flask_app.app_context():
+        token_revocation_list.sync()